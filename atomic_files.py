@@ -0,0 +1,25 @@
+# --- Sostituzione atomica dei file ---
+# Leaderboard, indice delle posizioni e classifiche unite si scrivono su un file temporaneo
+# nella stessa cartella, poi rinominato al posto di quello vecchio. Nessuna dipendenza da pygame.
+import os
+
+NEW_FILE_MODE=0o644 # Permessi chiesti per un file nuovo: il sistema toglie quelli della umask
+TEMP_OPEN_FLAGS=os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+
+
+def create_temp_file(path, prefix):
+    # Come tempfile.mkstemp ma con i permessi di un file normale (0644 meno la umask, applicata
+    # dal sistema in os.open) invece di 0600, senza leggere la umask con os.umask
+    directory=os.path.dirname(os.path.abspath(path))
+    while True:
+        tmp_path=os.path.join(directory, f"{prefix}{os.getpid()}-{os.urandom(4).hex()}.tmp")
+        try: return os.open(tmp_path, TEMP_OPEN_FLAGS, NEW_FILE_MODE), tmp_path
+        except FileExistsError: continue
+
+
+def replace_keeping_mode(tmp_path, path):
+    # os.replace di un file creato da create_temp_file: se sostituisce un file esistente gli
+    # si danno prima i permessi di quello, così un file reso privato (o condiviso) resta tale
+    try: os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+    except FileNotFoundError: pass
+    os.replace(tmp_path, path)
@@ -0,0 +1,150 @@
+# --- Audio di PySnake ---
+# Caricamento in background con cache del PCM decodificato: decodificare gli mp3 è una delle
+# parti più lente dell'avvio, quindi i suoni vengono caricati in un thread mentre il menu è
+# già interattivo e il PCM viene salvato su disco (chiave: hash del file + formato del
+# mixer) così i lanci successivi non decodificano più.
+# SoundManager gestisce canali riservati per categoria, priorità e volumi.
+import hashlib
+import os
+import threading
+import pygame
+
+AUDIO_FREQUENCY=44100; AUDIO_SAMPLE_SIZE=-16; AUDIO_CHANNELS=2
+AUDIO_BUFFER_SIZE=256 # Campioni per buffer: piccolo = suono del cibo con poca latenza
+
+
+def pre_init_mixer(buffer_size=AUDIO_BUFFER_SIZE):
+    # Da chiamare prima di pygame.init()
+    pygame.mixer.pre_init(AUDIO_FREQUENCY, AUDIO_SAMPLE_SIZE, AUDIO_CHANNELS, buffer_size)
+
+
+def file_digest(path):
+    digest=hashlib.sha256()
+    with open(path,'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b""): digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pcm_cache_path(cache_dir, sound_path, mixer_format):
+    frequency, sample_size, channels = mixer_format
+    return os.path.join(cache_dir, f"{file_digest(sound_path)}_{frequency}_{sample_size}_{channels}.pcm")
+
+
+def load_sound_cached(sound_path, cache_dir):
+    mixer_format=pygame.mixer.get_init()
+    if mixer_format is None: raise pygame.error("mixer non inizializzato")
+    cache_path=pcm_cache_path(cache_dir, sound_path, mixer_format)
+    if os.path.exists(cache_path):
+        with open(cache_path,'rb') as f: return pygame.mixer.Sound(buffer=f.read())
+    sound=pygame.mixer.Sound(sound_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path=cache_path+".tmp"
+        with open(tmp_path,'wb') as f: f.write(sound.get_raw())
+        os.replace(tmp_path, cache_path) # Mai un file PCM scritto a metà
+    except OSError as e: print(f"Errore salvataggio cache audio: {e}")
+    return sound
+
+
+class BackgroundSoundLoader:
+    # Carica i suoni {nome: file} in un thread e chiama on_loaded(nome, suono) per ognuno
+    # appena pronto. Finché un suono non è pronto chi lo usa trova il segnaposto None.
+    def __init__(self, sound_files, cache_dir, on_loaded):
+        self.sound_files=dict(sound_files); self.cache_dir=cache_dir; self.on_loaded=on_loaded
+        self.finished=threading.Event(); self.thread=None
+
+    def start(self):
+        self.thread=threading.Thread(target=self._run, name="sound-loader", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for name, path in self.sound_files.items():
+                try: self.on_loaded(name, load_sound_cached(path, self.cache_dir))
+                except (pygame.error, OSError) as e: print(f"Errore caricamento audio: {e}")
+        finally: self.finished.set()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+
+# Categorie di suoni: canali riservati e intervallo minimo (ms) tra due trigger dello stesso suono
+SOUND_CATEGORIES={
+    "gameplay":{"channels":2, "min_interval_ms":40},
+    "jingle":{"channels":1, "min_interval_ms":0},
+    "ui":{"channels":1, "min_interval_ms":30},
+}
+
+
+class SoundManager:
+    # Ogni categoria ha i suoi canali pre-allocati e riservati (pygame.mixer.set_reserved), così
+    # un suono non ruba mai il canale di un'altra categoria. Se i canali della categoria sono
+    # tutti occupati si ruba la voce con priorità più bassa (a parità, la più vecchia); se
+    # sono tutte più importanti il nuovo suono viene scartato. Lo stesso suono ripetuto prima
+    # di min_interval_ms viene ignorato, così il costo resta limitato a qualunque velocità.
+    # Il volume effettivo di ogni canale è master * categoria, applicato solo qui.
+    def __init__(self, categories=None, master_volume=1.0):
+        self.categories=dict(categories or SOUND_CATEGORIES)
+        self.master_volume=master_volume
+        self.category_volume={category: 1.0 for category in self.categories}
+        self.sounds={} # nome -> (Sound, categoria, priorità)
+        self.channels={} # categoria -> lista di [Channel, priorità della voce, inizio ms]
+        self.last_trigger_ms={}
+
+    def init_channels(self):
+        # Da chiamare dopo l'inizializzazione del mixer
+        if pygame.mixer.get_init() is None: return
+        total=sum(spec["channels"] for spec in self.categories.values())
+        if pygame.mixer.get_num_channels() < total: pygame.mixer.set_num_channels(total)
+        pygame.mixer.set_reserved(total)
+        channel_id=0
+        for category, spec in self.categories.items():
+            voices=[]
+            for _ in range(spec["channels"]):
+                voices.append([pygame.mixer.Channel(channel_id), 0, 0]); channel_id+=1
+            self.channels[category]=voices
+        self.apply_volumes()
+
+    def register(self, name, sound, category, priority=0):
+        if category not in self.categories: raise ValueError(f"Categoria audio sconosciuta: {category}")
+        sound.set_volume(1.0) # Il volume si regola solo sui canali
+        self.sounds[name]=(sound, category, priority)
+
+    def is_loaded(self, name):
+        return name in self.sounds
+
+    def play(self, name, now_ms=None):
+        entry=self.sounds.get(name)
+        if entry is None: return None # Non ancora caricato: segnaposto muto
+        sound, category, priority = entry
+        voices=self.channels.get(category)
+        if not voices: return None
+        if now_ms is None: now_ms=pygame.time.get_ticks()
+        last_ms=self.last_trigger_ms.get(name)
+        if last_ms is not None and now_ms-last_ms < self.categories[category]["min_interval_ms"]: return None
+        voice=None
+        for candidate in voices:
+            if not candidate[0].get_busy(): voice=candidate; break
+        if voice is None:
+            # Voice stealing: la voce meno importante e, a parità, la più vecchia
+            victim=min(voices, key=lambda v: (v[1], v[2]))
+            if victim[1] > priority: return None
+            voice=victim
+        channel=voice[0]
+        channel.play(sound); channel.set_volume(self.effective_volume(category))
+        voice[1]=priority; voice[2]=now_ms; self.last_trigger_ms[name]=now_ms
+        return channel
+
+    def effective_volume(self, category):
+        return self.master_volume*self.category_volume[category]
+
+    def apply_volumes(self):
+        for category, voices in self.channels.items():
+            volume=self.effective_volume(category)
+            for voice in voices: voice[0].set_volume(volume)
+
+    def set_master_volume(self, volume):
+        self.master_volume=max(0.0, min(1.0, volume)); self.apply_volumes()
+
+    def set_category_volume(self, category, volume):
+        self.category_volume[category]=max(0.0, min(1.0, volume)); self.apply_volumes()
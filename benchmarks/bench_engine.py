@@ -0,0 +1,58 @@
+# --- Benchmark: costo di un tick di SnakeEngine al variare della lunghezza ---
+# Uso: python benchmarks/bench_engine.py [larghezza] [altezza]
+# Lo snake viene disposto lungo un ciclo hamiltoniano e lo segue, così non muore mai:
+# il costo per tick deve restare piatto da lunghezza 1 fino alla board piena.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from snake_engine import SnakeEngine, MODE_BORDERLESS
+
+TICKS_PER_BATCH=32; MIN_TICKS=20000
+
+
+def hamiltonian_cycle(width, height):
+    # Riga 0 verso destra, serpentina sulle colonne 1..width-1, risalita sulla colonna 0
+    # (altezza pari necessaria per chiudere il ciclo)
+    cycle=[(x, 0) for x in range(width)]
+    for y in range(1, height):
+        xs=range(width-1, 0, -1) if y % 2 else range(1, width)
+        cycle.extend((x, y) for x in xs)
+    cycle.extend((0, y) for y in range(height-1, 0, -1))
+    return cycle
+
+
+def bench_length(engine, cycle, length):
+    n=len(cycle); total=0.0; ticks=0
+    while ticks < MIN_TICKS:
+        engine.reset(seed=ticks, mode=MODE_BORDERLESS)
+        cells=cycle[:length]; hx, hy = cells[-1]; nx, ny = cycle[length % n]
+        engine.set_snake(cells, (nx-hx, ny-hy))
+        pos=length % n
+        moves=[]
+        for _ in range(TICKS_PER_BATCH):
+            x, y = cycle[pos]; pos=(pos+1) % n; x2, y2 = cycle[pos]
+            moves.append((x2-x, y2-y))
+        start=time.perf_counter()
+        for direction in moves: engine.step(direction)
+        total+=time.perf_counter()-start; ticks+=TICKS_PER_BATCH
+    return total/ticks
+
+
+def main():
+    width=int(sys.argv[1]) if len(sys.argv)>1 else 64
+    height=int(sys.argv[2]) if len(sys.argv)>2 else 64
+    if height % 2: height+=1
+    engine=SnakeEngine(width, height); cycle=hamiltonian_cycle(width, height)
+    cells=width*height
+    lengths=sorted({1, 10, 100, 1000, cells//4, cells//2, cells-TICKS_PER_BATCH-1} & set(range(1, cells)))
+    print(f"Griglia {width}x{height} ({cells} celle)")
+    print(f"{'lunghezza':>10} {'us/tick':>10} {'tick/s':>12}")
+    for length in lengths:
+        per_tick=bench_length(engine, cycle, length)
+        print(f"{length:>10} {per_tick*1e6:>10.3f} {1/per_tick:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
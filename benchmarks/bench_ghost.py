@@ -0,0 +1,86 @@
+# --- Benchmark: costo del fantasma per frame ---
+# Uso: python benchmarks/bench_ghost.py [frame]
+# Registra una partita giocata da un bot, poi la presenta con GameAreaRenderer (driver video
+# "dummy", nessuna finestra) tick per tick due volte: da sola e con un fantasma che legge lo
+# stesso replay in parallelo. La differenza è il costo del fantasma (decodifica, tick del
+# suo motore, livello trasparente), confrontato con il tempo di un frame a MAX_FPS.
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy"); os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+import replay
+from snake_engine import SnakeEngine, DIRECTIONS, OPPOSITE, CELL_EMPTY, MODE_CLASSIC
+
+
+def bot_direction(engine, rng):
+    # Verso il cibo evitando le celle occupate: partite di qualche migliaio di tick
+    head_x, head_y = engine.head; food=engine.food_pos; options=[]
+    for direction in DIRECTIONS:
+        if direction == OPPOSITE[engine.direction]: continue
+        x=head_x+direction[0]; y=head_y+direction[1]
+        if 0 <= x < engine.grid_width and 0 <= y < engine.grid_height and engine.grid[y*engine.grid_width+x] == CELL_EMPTY:
+            options.append(direction)
+    if not options: return engine.direction
+    if food and rng.random() < 0.9: return min(options, key=lambda d: abs(head_x+d[0]-food[0])+abs(head_y+d[1]-food[1]))
+    return rng.choice(options)
+
+
+def record_bot_game(path, seed):
+    rng=random.Random(seed); engine=SnakeEngine(main.GRID_WIDTH, main.GRID_HEIGHT, main.NUM_RANDOM_OBSTACLES)
+    engine.reset(seed=seed, mode=MODE_CLASSIC)
+    writer=replay.ReplayWriter(path, replay.ReplayHeader.from_engine(engine))
+    while not engine.game_over:
+        previous=engine.direction; engine.step(bot_direction(engine, rng))
+        if engine.direction != previous: writer.record(engine.tick, engine.direction)
+        writer.after_step(engine)
+    writer.finish(engine.tick, engine.score, engine.snake_length)
+    return engine.tick
+
+
+def run(path, frames, with_ghost):
+    # Tempo medio per frame: tick della partita (letta dal replay), eventuale tick del
+    # fantasma, aggiornamento della board e presentazione dei rettangoli cambiati
+    live_reader=replay.ReplayReader(path); live=replay.ReplayPlayer(live_reader)
+    ghost_reader=replay.ReplayReader(path) if with_ghost else None
+    ghost=replay.ReplayPlayer(ghost_reader) if with_ghost else None
+    renderer=main.GameAreaRenderer()
+    if ghost: renderer.set_ghost(ghost.engine)
+    renderer.present(live.engine, 0)
+    total=0.0
+    for _ in range(frames):
+        if live.engine.game_over:
+            live.seek(0); renderer.invalidate()
+            if ghost: ghost.seek(0)
+            renderer.present(live.engine, 0)
+        start=time.perf_counter()
+        live.step(); renderer.apply_step(live.engine)
+        if ghost:
+            ghost.step(); renderer.apply_ghost_step(ghost.engine)
+        renderer.present(live.engine, 0)
+        total+=time.perf_counter()-start
+    live_reader.close()
+    if ghost_reader: ghost_reader.close()
+    return total/frames
+
+
+def main_bench():
+    frames=int(sys.argv[1]) if len(sys.argv)>1 else 20000
+    main.bootstrap()
+    with tempfile.TemporaryDirectory() as directory:
+        path=os.path.join(directory, "bot.psr"); ticks=record_bot_game(path, 1)
+        run(path, 500, True) # Riscaldamento (sprite e rect in cache)
+        base=run(path, frames, False); with_ghost=run(path, frames, True)
+    budget=1.0/main.MAX_FPS; overhead=with_ghost-base
+    print(f"partita registrata: {ticks:,} tick, {frames:,} frame misurati")
+    print(f"frame senza fantasma: {base*1e6:8.1f} us")
+    print(f"frame con fantasma:   {with_ghost*1e6:8.1f} us")
+    print(f"costo del fantasma:   {overhead*1e6:8.1f} us = {100*overhead/budget:.2f}% di un frame a {main.MAX_FPS} FPS")
+
+
+if __name__ == '__main__':
+    main_bench()
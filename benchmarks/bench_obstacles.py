@@ -0,0 +1,47 @@
+# --- Benchmark: generazione degli ostacoli su griglie grandi ---
+# Uso: python benchmarks/bench_obstacles.py [larghezza] [altezza] [densità]
+# Misura generate_random_obstacles e verifica con una BFS che tutte le celle libere
+# siano raggiungibili dalla posizione di partenza dello snake.
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from snake_engine import generate_random_obstacles
+
+RUNS=5
+
+
+def reachable_cells(width, height, obstacles, start):
+    blocked=bytearray(width*height)
+    for x, y in obstacles: blocked[y*width+x]=1
+    seen=bytearray(blocked); start_idx=start[1]*width+start[0]; seen[start_idx]=1
+    queue=deque([start_idx]); count=1
+    while queue:
+        idx=queue.popleft(); x=idx % width
+        for n in (idx-width if idx >= width else -1, idx+width if idx+width < width*height else -1,
+                  idx-1 if x > 0 else -1, idx+1 if x < width-1 else -1):
+            if n >= 0 and not seen[n]: seen[n]=1; queue.append(n); count+=1
+    return width*height-len(obstacles), count
+
+
+def main():
+    width=int(sys.argv[1]) if len(sys.argv)>1 else 200
+    height=int(sys.argv[2]) if len(sys.argv)>2 else 200
+    density=float(sys.argv[3]) if len(sys.argv)>3 else 0.3
+    start=(width//2, height//2); requested=int(width*height*density)
+    print(f"Griglia {width}x{height}, {requested} ostacoli richiesti ({density:.0%})")
+    for seed in range(RUNS):
+        rng=random.Random(seed)
+        t0=time.perf_counter()
+        obstacles=generate_random_obstacles(rng, requested, [start], width, height)
+        elapsed=time.perf_counter()-t0
+        free, reached = reachable_cells(width, height, obstacles, start)
+        print(f"seed {seed}: {len(obstacles)} ostacoli in {elapsed*1000:.1f} ms, "
+              f"celle libere raggiungibili {reached}/{free}{'' if reached == free else '  <-- NON CONNESSA'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# --- Benchmark: indice delle posizioni (score_index.py) ---
+# Uso: python benchmarks/bench_rank.py [numero_punteggi]
+# Inserisce N punteggi casuali in più modalità, poi misura posizione/percentile, il
+# salvataggio e il caricamento dell'indice. Le posizioni vengono confrontate con un
+# conteggio diretto su un campione di punteggi.
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from score_index import ScoreRankIndex
+from snake_engine import GAME_MODES, POINTS_PER_FOOD
+
+NUM_QUERIES=100000; NUM_CHECKS=50
+
+
+def main():
+    count=int(sys.argv[1]) if len(sys.argv)>1 else 1000000
+    rng=random.Random(1)
+    # Distribuzione sbilanciata come quella reale: tante partite brevi, poche lunghe
+    scores=[int(rng.expovariate(1/30))*POINTS_PER_FOOD for _ in range(count)]
+    modes=[rng.choice(GAME_MODES) for _ in range(count)]
+    index=ScoreRankIndex()
+
+    start=time.perf_counter()
+    for score, mode in zip(scores, modes): index.add_score(score, mode)
+    insert_time=time.perf_counter()-start
+
+    queries=[rng.choice(scores) for _ in range(NUM_QUERIES)]
+    start=time.perf_counter()
+    for score in queries: index.rank(score, GAME_MODES[0]); index.percentile(score)
+    query_time=time.perf_counter()-start
+
+    for score in queries[:NUM_CHECKS]:
+        expected=1+sum(1 for other in scores if other > score)
+        assert index.rank(score) == expected, (score, index.rank(score), expected)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path=os.path.join(directory, "leaderboard.ranks")
+        start=time.perf_counter(); index.save(path); save_time=time.perf_counter()-start
+        size=os.path.getsize(path)
+        start=time.perf_counter(); loaded=ScoreRankIndex.load(path); load_time=time.perf_counter()-start
+        assert loaded.total() == count and loaded.rank(queries[0]) == index.rank(queries[0])
+
+    print(f"{count:,} punteggi, {len(GAME_MODES)} modalità")
+    print(f"inserimento:        {insert_time/count*1e6:8.3f} us/punteggio")
+    print(f"posizione+percent.: {query_time/NUM_QUERIES*1e6:8.3f} us/query")
+    print(f"salvataggio:        {save_time*1e3:8.3f} ms ({size:,} byte)")
+    print(f"caricamento:        {load_time*1e3:8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
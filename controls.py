@@ -0,0 +1,186 @@
+# --- Comandi di direzione della partita ---
+# Tastiera (WASD) e gamepad (croce direzionale o levetta sinistra) passano da qui. Gli eventi
+# vengono letti a ogni frame, cioè alla frequenza dello schermo e non a quella dei tick, e ogni
+# comando entra in una coda corta con l'istante in cui è arrivato. Ogni tick ne applica uno:
+# due pressioni rapide nello stesso tick (es. su e subito sinistra per girare a U) diventano
+# due svolte in due tick consecutivi invece di sovrascriversi. Già in coda si scartano i
+# comandi che non cambiano nulla o che invertirebbero il senso rispetto all'ultima direzione
+# in coda (step() li ignorerebbe comunque, ma occuperebbero un tick).
+# Per ogni comando applicato si misurano due ritardi dal suo arrivo: fino al tick che lo
+# applica e fino al primo pygame.display.update() che ne mostra il risultato (frame_shown()).
+# Vanno in istogrammi a memoria fissa, esportabili in JSON per confrontare macchine e renderer.
+import json
+import math
+import time
+from array import array
+from collections import deque
+
+import pygame
+
+from snake_engine import UP, DOWN, LEFT, RIGHT, OPPOSITE
+
+KEY_DIRECTIONS={pygame.K_w:UP, pygame.K_a:LEFT, pygame.K_s:DOWN, pygame.K_d:RIGHT}
+HAT_DIRECTIONS={(0,1):UP, (0,-1):DOWN, (-1,0):LEFT, (1,0):RIGHT} # La y della croce cresce verso l'alto
+DIRECTION_QUEUE_SIZE=3 # Comandi in attesa al massimo: oltre si scartano (tasti tenuti, rimbalzi)
+STICK_PRESS=0.6; STICK_RELEASE=0.3 # Levetta: comando oltre STICK_PRESS, di nuovo pronta sotto STICK_RELEASE
+GAMEPAD_PAUSE_BUTTON=7 # Start sui controller in stile XInput
+HISTOGRAM_BIN_MS=0.5; HISTOGRAM_BINS=4000 # Ritardi fino a 2 s a passi di 0,5 ms, oltre nell'ultimo bin
+
+
+def sdl_timestamps_available():
+    # pygame espone il timestamp SDL degli eventi solo in alcune versioni: altrimenti
+    # l'arrivo di un comando è il frame che lo legge (al più 1/RENDER_FPS dopo)
+    return hasattr(pygame.event.Event(pygame.USEREVENT), "timestamp")
+
+
+def event_time(event, now):
+    # Istante dell'evento sull'orologio di perf_counter: il timestamp SDL dove pygame lo
+    # espone (in ms, stesso orologio di get_ticks), altrimenti quando è stato letto (now)
+    timestamp=getattr(event, "timestamp", None)
+    if not timestamp: return now
+    return now-max(pygame.time.get_ticks()-timestamp, 0)/1000.0
+
+
+def is_pause_event(event):
+    return (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE) or \
+           (event.type == pygame.JOYBUTTONDOWN and event.button == GAMEPAD_PAUSE_BUTTON)
+
+
+class DirectionQueue:
+    def __init__(self, capacity=DIRECTION_QUEUE_SIZE):
+        self.items=deque(); self.capacity=capacity # (direzione, istante di arrivo)
+        self.rejected=0; self.dropped=0 # Comandi inutili o al contrario / coda piena
+
+    def clear(self):
+        self.items.clear()
+
+    def push(self, direction, timestamp, current_direction):
+        # False se il comando è scartato; il confronto è con l'ultima direzione in coda
+        last=self.items[-1][0] if self.items else current_direction
+        if direction == last or direction == OPPOSITE[last]: self.rejected+=1; return False
+        if len(self.items) >= self.capacity: self.dropped+=1; return False
+        self.items.append((direction, timestamp)); return True
+
+    def peek(self, current_direction):
+        return self.items[0][0] if self.items else current_direction
+
+    def pop(self):
+        return self.items.popleft() if self.items else None
+
+
+class LatencyHistogram:
+    # Ritardi in bin da bin_ms: percentili con l'errore di un bin, memoria costante
+    def __init__(self, bin_ms=HISTOGRAM_BIN_MS, bins=HISTOGRAM_BINS):
+        self.bin_ms=bin_ms; self.counts=array('I', [0])*bins
+        self.count=0; self.total=0.0; self.worst=0.0
+
+    def add(self, seconds):
+        seconds=max(seconds, 0.0); self.count+=1; self.total+=seconds
+        if seconds > self.worst: self.worst=seconds
+        self.counts[min(int(seconds*1000/self.bin_ms), len(self.counts)-1)]+=1
+
+    def percentile(self, p):
+        # ms: limite superiore del bin che contiene il p-esimo percentile (None se vuoto)
+        if not self.count: return None
+        rank=max(1, math.ceil(self.count*p/100)); seen=0
+        for i, count in enumerate(self.counts):
+            seen+=count
+            if seen >= rank: return min((i+1)*self.bin_ms, round(self.worst*1000, 3))
+
+    def summary(self):
+        if not self.count: return "nessun comando"
+        return (f"{self.count} comandi, p50 {self.percentile(50):.1f} ms, p95 {self.percentile(95):.1f} ms, "
+                f"p99 {self.percentile(99):.1f} ms, massimo {self.worst*1000:.1f} ms")
+
+    def to_dict(self):
+        report={"count":self.count, "bin_ms":self.bin_ms}
+        if self.count:
+            report.update(mean_ms=round(self.total/self.count*1000, 3), p50_ms=self.percentile(50), p95_ms=self.percentile(95),
+                          p99_ms=self.percentile(99), max_ms=round(self.worst*1000, 3))
+        report["bins"]=[[i*self.bin_ms, count] for i, count in enumerate(self.counts) if count] # [inizio del bin in ms, comandi]
+        return report
+
+
+class GameInput:
+    def __init__(self):
+        self.queue=DirectionQueue()
+        self.tick_latency=LatencyHistogram(); self.display_latency=LatencyHistogram()
+        self.waiting_display=[] # Arrivo dei comandi applicati ma non ancora mostrati
+        self.gamepads={} # instance_id -> Joystick (vanno tenuti aperti per ricevere eventi)
+        self.stick_axes={}; self.stick_fired=set() # Posizione della levetta per gamepad
+        self.rescan_gamepads()
+
+    def rescan_gamepads(self):
+        # Apre i gamepad collegati: quelli già presenti all'avvio e quelli collegati mentre
+        # erano aperti i menu, i cui JOYDEVICEADDED sono stati letti (e scartati) dai loro loop.
+        # Il dizionario nuovo si riempie prima di lasciare il vecchio, così i gamepad già aperti
+        # non vengono chiusi nel frattempo
+        gamepads={}
+        for index in range(pygame.joystick.get_count()): self.add_gamepad(index, gamepads)
+        self.gamepads=gamepads
+
+    def add_gamepad(self, device_index, gamepads=None):
+        try: gamepad=pygame.joystick.Joystick(device_index)
+        except pygame.error: return
+        (self.gamepads if gamepads is None else gamepads)[gamepad.get_instance_id()]=gamepad
+
+    def clear(self):
+        # Pausa, riavvolgimento, nuova partita: i comandi in sospeso non si misurano
+        self.queue.clear(); self.waiting_display.clear()
+        if pygame.joystick.get_count() != len(self.gamepads): self.rescan_gamepads()
+
+    def handle_event(self, event, current_direction, now):
+        # Mette in coda il comando portato dall'evento (se ce n'è uno); True se l'evento era
+        # un comando di direzione, anche se scartato
+        kind=event.type
+        if kind == pygame.KEYDOWN: direction=KEY_DIRECTIONS.get(event.key)
+        elif kind == pygame.JOYHATMOTION: direction=HAT_DIRECTIONS.get(tuple(event.value))
+        elif kind == pygame.JOYAXISMOTION and event.axis in (0, 1): direction=self.stick_direction(event)
+        elif kind == pygame.JOYDEVICEADDED: self.add_gamepad(event.device_index); return False
+        elif kind == pygame.JOYDEVICEREMOVED:
+            self.gamepads.pop(event.instance_id, None); self.stick_axes.pop(event.instance_id, None); return False
+        else: return False
+        if direction is not None: self.queue.push(direction, event_time(event, now), current_direction)
+        return True
+
+    def stick_direction(self, event):
+        # Un comando per spinta: la levetta deve tornare verso il centro prima del successivo
+        instance_id=event.instance_id; axes=self.stick_axes.setdefault(instance_id, [0.0, 0.0])
+        axes[event.axis]=event.value; x, y = axes; strength=max(abs(x), abs(y))
+        if strength < STICK_RELEASE: self.stick_fired.discard(instance_id); return None
+        if strength < STICK_PRESS or instance_id in self.stick_fired: return None
+        self.stick_fired.add(instance_id)
+        if abs(x) > abs(y): return RIGHT if x > 0 else LEFT
+        return DOWN if y > 0 else UP
+
+    def next_direction(self, current_direction, now=None):
+        # Direzione per il tick che sta per essere simulato
+        item=self.queue.pop()
+        if item is None: return current_direction
+        direction, timestamp = item
+        self.tick_latency.add((time.perf_counter() if now is None else now)-timestamp)
+        self.waiting_display.append(timestamp)
+        return direction
+
+    def frame_shown(self, now=None):
+        # Da chiamare subito dopo pygame.display.update(): chiude i comandi applicati nel frame
+        if not self.waiting_display: return
+        if now is None: now=time.perf_counter()
+        for timestamp in self.waiting_display: self.display_latency.add(now-timestamp)
+        self.waiting_display.clear()
+
+    def peek_direction(self, current_direction):
+        return self.queue.peek(current_direction)
+
+    def summary(self):
+        return (f"comando -> tick: {self.tick_latency.summary()}\n"
+                f"comando -> schermo: {self.display_latency.summary()}\n"
+                f"scartati: {self.queue.rejected} inutili o al contrario, {self.queue.dropped} a coda piena")
+
+    def write_report(self, path, info):
+        # Istogrammi e percentili in JSON; info descrive la macchina e le impostazioni
+        report=dict(info)
+        report.update(event_timestamps="sdl" if sdl_timestamps_available() else "frame",
+                      rejected=self.queue.rejected, dropped=self.queue.dropped,
+                      input_to_tick=self.tick_latency.to_dict(), input_to_display=self.display_latency.to_dict())
+        with open(path, 'w') as f: json.dump(report, f, indent=2)
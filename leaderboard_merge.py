@@ -0,0 +1,254 @@
+# --- Unione offline delle leaderboard di più macchine ---
+# Uso: python leaderboard_merge.py leaderboard*.json altri/*.db -o unita.json [--top N]
+# Legge qualunque numero di leaderboard.json (letti in streaming, un elemento alla volta) e
+# database SQLite (letti con un cursore già ordinato), li unisce per punteggio con un merge
+# a k vie, elimina le voci identiche (nome, punteggio, data, modalità) e scrive la
+# classifica unita (i primi N o lo storico completo) in JSON o in un database .db.
+# La memoria resta limitata: le voci JSON vengono ordinate a blocchi di --run-size e
+# salvate in file temporanei (run), e non si tengono mai aperti più di --fan-in file alla
+# volta: se i run sono di più si uniscono in più passate.
+import argparse
+import heapq
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import atomic_files
+import leaderboard_store
+
+DEFAULT_RUN_SIZE=100000; DEFAULT_FAN_IN=64
+READ_CHUNK_SIZE=65536; MAX_ITEM_SIZE=1<<20 # Oltre questa dimensione un elemento è considerato non valido
+
+
+def sort_key(entry):
+    # Punteggio decrescente; a parità, prima chi l'ha fatto prima. La chiave distingue
+    # tutti i campi (anche assente da vuoto), quindi le voci identiche finiscono sempre una
+    # accanto all'altra e per eliminarle basta confrontarle con la precedente.
+    timestamp=entry.get("timestamp"); mode=entry.get("mode")
+    return (-entry["score"], timestamp is not None, timestamp or 0, entry["name"], mode is not None, mode or "")
+
+
+def make_merged_entry(name, score, mode=None, timestamp=None, replay=None, length=None):
+    # Come make_entry, ma una data mancante resta mancante. replay e length passano così
+    # come sono: servono a replay_verify.py anche sulla classifica unita
+    entry={"name":name, "score":score}
+    if mode is not None: entry["mode"]=mode
+    if timestamp is not None: entry["timestamp"]=timestamp
+    if replay is not None: entry["replay"]=replay
+    if length is not None: entry["length"]=length
+    return entry
+
+
+def iter_json_array(path, stats):
+    for item in iter_json_items(path, stats):
+        yield make_merged_entry(item["name"], item["score"], item.get("mode"), item.get("timestamp"), item.get("replay"), item.get("length"))
+
+
+def iter_json_items(path, stats):
+    # Legge un array JSON un elemento alla volta con raw_decode su blocchi del file: la
+    # memoria usata è quella di un blocco, non quella del file intero. Restituisce le voci
+    # valide così come sono nel file.
+    decoder=json.JSONDecoder()
+    with open(path,'r',encoding='utf-8') as f:
+        buffer=f.read(READ_CHUNK_SIZE).lstrip(); eof=False
+        if not buffer.startswith("["):
+            print(f"{path}: non è un array JSON, ignorato", file=sys.stderr); return
+        pos=1
+        while True:
+            while True: # Salta spazi e virgole tra gli elementi
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,": pos+=1
+                if pos < len(buffer) or eof: break
+                buffer=f.read(READ_CHUNK_SIZE); pos=0; eof=not buffer
+            if pos >= len(buffer):
+                print(f"{path}: file troncato", file=sys.stderr); return
+            if buffer[pos] == "]": return
+            try: item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    print(f"{path}: JSON non valido", file=sys.stderr); return
+                if len(buffer)-pos > MAX_ITEM_SIZE:
+                    print(f"{path}: JSON non valido", file=sys.stderr); return
+                chunk=f.read(READ_CHUNK_SIZE); eof=not chunk
+                buffer=buffer[pos:]+chunk; pos=0
+                continue
+            pos=end
+            if leaderboard_store.is_valid_entry(item): stats["read"]+=1; yield item
+            else: stats["invalid"]+=1
+
+
+def iter_sqlite(path, stats):
+    # Cursore già ordinato come sort_key: SQLite ordina su disco se serve. Le colonne SQLite
+    # accettano valori di qualunque tipo: le righe con tipi sbagliati si scartano come nei JSON
+    conn=sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        # I database creati prima dei replay non hanno le colonne replay e length
+        existing={row[1] for row in conn.execute("PRAGMA table_info(scores)")}
+        extra=", ".join(column if column in existing else "NULL" for column in ("replay", "length"))
+        cursor=conn.execute(f"SELECT name, score, mode, timestamp, {extra} FROM scores ORDER BY score DESC, "
+                            "timestamp IS NOT NULL, COALESCE(timestamp, 0), name, mode IS NOT NULL, COALESCE(mode, '')")
+        for name, score, mode, timestamp, replay, length in cursor:
+            entry=make_merged_entry(name, score, mode, timestamp, replay, length)
+            if leaderboard_store.is_valid_entry(entry): stats["read"]+=1; yield entry
+            else: stats["invalid"]+=1
+    finally: conn.close()
+
+
+def iter_run(path):
+    with open(path,'r',encoding='utf-8') as f:
+        for line in f: yield json.loads(line)
+
+
+def dedupe(entries, stats):
+    # Doppioni: stessa chiave (nome, punteggio, data, modalità), anche se solo una delle
+    # copie ricorda il replay; si tiene la prima, completata con il replay di un'altra
+    kept=None; kept_key=None
+    for entry in entries:
+        key=sort_key(entry)
+        if key == kept_key:
+            stats["duplicates"]+=1
+            if "replay" not in kept and "replay" in entry:
+                kept=dict(kept, replay=entry["replay"])
+                if "length" in entry: kept["length"]=entry["length"]
+            continue
+        if kept is not None: yield kept
+        kept=entry; kept_key=key
+    if kept is not None: yield kept
+
+
+def take(entries, limit):
+    for count, entry in enumerate(entries):
+        if limit is not None and count >= limit: return
+        yield entry
+
+
+class RunWriter:
+    # Scrive run ordinati (una voce JSON per riga) nella cartella temporanea
+    def __init__(self, directory):
+        self.directory=directory; self.count=0
+
+    def write(self, entries):
+        self.count+=1
+        path=os.path.join(self.directory, f"run{self.count:06d}.jsonl")
+        with open(path,'w',encoding='utf-8') as f:
+            for entry in entries: f.write(json.dumps(entry)+"\n")
+        return path
+
+
+def merge_sources(sources, stats, limit=None):
+    # sources: funzioni senza argomenti che aprono e restituiscono un iteratore ordinato
+    merged=heapq.merge(*(source() for source in sources), key=sort_key)
+    return take(dedupe(merged, stats), limit)
+
+
+def build_runs(paths, run_writer, stats, run_size, limit=None):
+    # Le voci dei file JSON vengono raccolte in un buffer, ordinate e salvate a blocchi;
+    # i database sono già run ordinati e restano dove sono
+    sources=[]; buffer=[]
+
+    def spill():
+        buffer.sort(key=sort_key)
+        path=run_writer.write(take(dedupe(buffer, stats), limit)); buffer.clear()
+        sources.append(lambda: iter_run(path))
+
+    for path in paths:
+        if path.endswith(".db"):
+            sources.append(lambda path=path: iter_sqlite(path, stats)); stats["inputs"]+=1; continue
+        try:
+            for entry in iter_json_array(path, stats):
+                buffer.append(entry)
+                if len(buffer) >= run_size: spill()
+            stats["inputs"]+=1
+        except (OSError, UnicodeDecodeError) as e: print(f"{path}: {e}", file=sys.stderr)
+    if buffer: spill()
+    return sources
+
+
+def reduce_runs(sources, run_writer, stats, fan_in, limit=None):
+    # Più passate finché i run da unire non stanno tutti aperti insieme
+    while len(sources) > fan_in:
+        merged=[]
+        for i in range(0, len(sources), fan_in):
+            path=run_writer.write(merge_sources(sources[i:i+fan_in], stats, limit))
+            merged.append(lambda path=path: iter_run(path))
+        sources=merged; stats["passes"]+=1
+    return sources
+
+
+def write_json_output(path, entries):
+    # In streaming su un file temporaneo, poi rinominato: nessun file scritto a metà
+    written=0
+    fd, tmp_path = atomic_files.create_temp_file(path, ".leaderboard-")
+    try:
+        with os.fdopen(fd,'w',encoding='utf-8') as f:
+            f.write("[")
+            for entry in entries:
+                f.write(",\n  " if written else "\n  "); f.write(json.dumps(entry)); written+=1
+            f.write("\n]\n" if written else "]\n"); f.flush(); os.fsync(f.fileno())
+        atomic_files.replace_keeping_mode(tmp_path, path)
+    except BaseException:
+        try: os.unlink(tmp_path)
+        except OSError: pass
+        raise
+    return written
+
+
+def write_sqlite_output(path, entries):
+    # Database nuovo accanto a quello finale, poi rinominato come per il JSON
+    counter=[0]
+    def counted():
+        for entry in entries: counter[0]+=1; yield entry
+    tmp_path=path+".merge-tmp"
+    for stale in (tmp_path, tmp_path+"-wal", tmp_path+"-shm"):
+        if os.path.exists(stale): os.remove(stale)
+    store=leaderboard_store.SqliteLeaderboard(tmp_path)
+    try: store.add_entries(counted())
+    finally: store.close()
+    os.replace(tmp_path, path)
+    return counter[0]
+
+
+def merge_leaderboards(inputs, output, limit=None, run_size=DEFAULT_RUN_SIZE, fan_in=DEFAULT_FAN_IN, temp_dir=None):
+    stats={"inputs":0, "read":0, "invalid":0, "duplicates":0, "passes":1, "written":0}
+    if os.path.abspath(output) in {os.path.abspath(path) for path in inputs}:
+        raise ValueError("il file di uscita non può essere anche un file di ingresso")
+    with tempfile.TemporaryDirectory(prefix="leaderboard-merge-", dir=temp_dir) as directory:
+        run_writer=RunWriter(directory)
+        sources=build_runs(inputs, run_writer, stats, run_size, limit)
+        sources=reduce_runs(sources, run_writer, stats, fan_in, limit)
+        entries=merge_sources(sources, stats, limit)
+        if output.endswith(".db"): stats["written"]=write_sqlite_output(output, entries)
+        else: stats["written"]=write_json_output(output, entries)
+    return stats
+
+
+def parse_args(argv=None):
+    parser=argparse.ArgumentParser(description="Unisce le leaderboard di PySnake di più macchine")
+    parser.add_argument("inputs", nargs="+", help="file leaderboard .json o database .db")
+    parser.add_argument("-o", "--output", required=True, help="file risultato (.json o .db)")
+    parser.add_argument("--top", type=int, default=None, help="tieni solo i primi N punteggi (default: storico completo)")
+    parser.add_argument("--run-size", type=int, default=DEFAULT_RUN_SIZE, help="voci ordinate in memoria per ogni run temporaneo")
+    parser.add_argument("--fan-in", type=int, default=DEFAULT_FAN_IN, help="file aperti al massimo durante un merge")
+    parser.add_argument("--temp-dir", default=None, help="cartella per i run temporanei")
+    args=parser.parse_args(argv)
+    if args.run_size < 1 or args.fan_in < 2 or (args.top is not None and args.top < 1):
+        parser.error("--run-size e --top devono essere positivi, --fan-in almeno 2")
+    return args
+
+
+def main(argv=None):
+    args=parse_args(argv)
+    start=time.perf_counter()
+    try: stats=merge_leaderboards(args.inputs, args.output, args.top, args.run_size, args.fan_in, args.temp_dir)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Errore: {e}", file=sys.stderr); return 1
+    print(f"{stats['inputs']} file, {stats['read']:,} voci lette, {stats['invalid']:,} non valide, "
+          f"{stats['duplicates']:,} duplicate, {stats['written']:,} scritte in {args.output} "
+          f"({stats['passes']} passate, {time.perf_counter()-start:.2f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,504 @@
+# --- Archivio della leaderboard di PySnake ---
+# Backend intercambiabili con la stessa interfaccia:
+#   JsonLeaderboard   - il formato storico leaderboard.json (solo i primi N punteggi)
+#   SqliteLeaderboard - storico completo in SQLite (WAL) con indici su punteggio,
+#                       modalità, giocatore e data: top-N, classifiche per modalità e
+#                       record personali si leggono dagli indici, senza scansioni.
+# LeaderboardService tiene i dati in memoria e scrive su disco in un thread separato;
+# se gli si passa un file per l'indice delle posizioni (score_index.py) sa dire anche in
+# che posizione si piazza ogni partita tra tutte quelle giocate.
+# Nessuna dipendenza da pygame.
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import atomic_files
+import score_index
+
+BACKEND_JSON="json"; BACKEND_SQLITE="sqlite"
+BACKENDS=(BACKEND_JSON, BACKEND_SQLITE)
+
+
+def make_entry(name, score, mode=None, timestamp=None, replay=None, length=None):
+    # replay (nome del file in replays/) e length (lunghezza finale dello snake) servono a
+    # ricontrollare il punteggio ri-simulando la partita
+    entry={"name":name, "score":int(score)}
+    if mode is not None: entry["mode"]=mode
+    entry["timestamp"]=int(time.time()) if timestamp is None else timestamp
+    if replay is not None: entry["replay"]=replay
+    if length is not None: entry["length"]=int(length)
+    return entry
+
+
+OPTIONAL_FIELD_TYPES={"mode":str, "timestamp":int, "replay":str, "length":int}
+
+
+def is_valid_entry(entry):
+    # I campi facoltativi, se presenti, devono avere il loro tipo: una voce con una data
+    # testuale o una modalità numerica non si può ordinare insieme alle altre. Un punteggio
+    # negativo o oltre quello di una griglia piena può venire solo da un file modificato
+    return isinstance(entry,dict) and "name" in entry and "score" in entry and \
+           isinstance(entry["name"],str) and isinstance(entry["score"],int) and \
+           0 <= entry["score"] <= score_index.MAX_SCORE and \
+           all(entry.get(field) is None or isinstance(entry[field],field_type) for field, field_type in OPTIONAL_FIELD_TYPES.items())
+
+
+def sort_entries(entries):
+    return sorted(entries, key=lambda x: x["score"], reverse=True)
+
+
+def file_token(*paths):
+    # (mtime, dimensione) dei file: cambia quando qualcuno li riscrive
+    token=[]
+    for path in paths:
+        try: stat=os.stat(path); token.append((stat.st_mtime_ns, stat.st_size))
+        except OSError: token.append(None)
+    return tuple(token)
+
+
+def atomic_write_json(path, data):
+    # Scrive su un file temporaneo nella stessa cartella e lo rinomina: chi legge vede il
+    # file vecchio o quello nuovo, mai uno scritto a metà, anche se il processo muore.
+    fd, tmp_path = atomic_files.create_temp_file(path, ".leaderboard-")
+    try:
+        with os.fdopen(fd,'w') as f:
+            json.dump(data,f,indent=2); f.flush(); os.fsync(f.fileno())
+        atomic_files.replace_keeping_mode(tmp_path, path)
+    except BaseException:
+        try: os.unlink(tmp_path)
+        except OSError: pass
+        raise
+
+
+class LeaderboardBackend:
+    def add_entry(self, entry): raise NotImplementedError
+    def top(self, limit, mode=None): raise NotImplementedError
+    def personal_best(self, name, mode=None): raise NotImplementedError
+    def count(self, mode=None): raise NotImplementedError
+    def iter_scores(self): raise NotImplementedError # (punteggio, modalità) di tutte le voci
+    # Righe [offset, offset+limit) della classifica come (chiave, voce); after/before sono le
+    # chiavi dell'ultima riga della pagina precedente e della prima della successiva, usate dai
+    # backend che sanno ripartire da lì invece di contare offset righe
+    def page(self, offset, limit, mode=None, after=None, before=None): raise NotImplementedError
+    def position(self, name, mode=None): raise NotImplementedError # Riga (da 0) del record personale
+    def count_at_least(self, score, mode=None): raise NotImplementedError # Voci con punteggio >= score
+    def change_token(self): raise NotImplementedError
+    def close(self): pass
+
+
+class JsonLeaderboard(LeaderboardBackend):
+    def __init__(self, path, max_entries):
+        self.path=path; self.max_entries=max_entries
+
+    def load(self):
+        if not os.path.exists(self.path): return []
+        try:
+            with open(self.path,'r') as f: data=json.load(f)
+            if not isinstance(data,list): return []
+            return sort_entries([entry for entry in data if is_valid_entry(entry)])[:self.max_entries]
+        except(IOError,ValueError): return []
+
+    def save(self, entries):
+        try: atomic_write_json(self.path, entries)
+        except IOError: print(f"Errore salvataggio leaderboard: {self.path}")
+
+    def add_entry(self, entry):
+        entries=self.load(); entries.append(entry)
+        self.save(sort_entries(entries)[:self.max_entries])
+
+    def top(self, limit, mode=None):
+        entries=self.load()
+        if mode is not None: entries=[entry for entry in entries if entry.get("mode")==mode]
+        return entries[:limit]
+
+    def personal_best(self, name, mode=None):
+        for entry in self.top(self.max_entries, mode):
+            if entry["name"]==name: return entry
+        return None
+
+    def count(self, mode=None):
+        return len(self.top(self.max_entries, mode))
+
+    def iter_scores(self):
+        for entry in self.load(): yield entry["score"], entry.get("mode")
+
+    def page(self, offset, limit, mode=None, after=None, before=None):
+        entries=self.top(self.max_entries, mode)
+        return [(offset+i, entry) for i, entry in enumerate(entries[offset:offset+limit])]
+
+    def position(self, name, mode=None):
+        for i, entry in enumerate(self.top(self.max_entries, mode)):
+            if entry["name"]==name: return i
+        return None
+
+    def count_at_least(self, score, mode=None):
+        return sum(1 for entry in self.top(self.max_entries, mode) if entry["score"] >= score)
+
+    def change_token(self):
+        return file_token(self.path)
+
+
+class SqliteLeaderboard(LeaderboardBackend):
+    SCHEMA=(
+        "CREATE TABLE IF NOT EXISTS scores (id INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+        "score INTEGER NOT NULL, mode TEXT, timestamp INTEGER, replay TEXT, length INTEGER)",
+        "CREATE INDEX IF NOT EXISTS idx_scores_score ON scores (score DESC, id)",
+        "CREATE INDEX IF NOT EXISTS idx_scores_mode_score ON scores (mode, score DESC, id)",
+        "CREATE INDEX IF NOT EXISTS idx_scores_name_score ON scores (name, score DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_scores_timestamp ON scores (timestamp)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    )
+    COLUMNS="name, score, mode, timestamp, replay, length"
+    ADDED_COLUMNS=(("replay", "TEXT"), ("length", "INTEGER")) # Assenti nei database creati prima
+
+    def __init__(self, path):
+        self.path=path
+        # La connessione è condivisa tra il thread della UI e quello di scrittura: il lock
+        # serializza le chiamate
+        self.lock=threading.RLock()
+        self.conn=sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            for statement in self.SCHEMA: self.conn.execute(statement)
+            existing={row[1] for row in self.conn.execute("PRAGMA table_info(scores)")}
+            for column, column_type in self.ADDED_COLUMNS:
+                if column not in existing: self.conn.execute(f"ALTER TABLE scores ADD COLUMN {column} {column_type}")
+
+    @staticmethod
+    def row_to_entry(row):
+        name, score, mode, timestamp, replay, length = row
+        entry={"name":name, "score":score}
+        if mode is not None: entry["mode"]=mode
+        if timestamp is not None: entry["timestamp"]=timestamp
+        if replay is not None: entry["replay"]=replay
+        if length is not None: entry["length"]=length
+        return entry
+
+    def add_entry(self, entry):
+        self.add_entries((entry,))
+
+    def add_entries(self, entries):
+        with self.lock, self.conn:
+            self.conn.executemany(f"INSERT INTO scores ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                                  ((e["name"], e["score"], e.get("mode"), e.get("timestamp"), e.get("replay"), e.get("length")) for e in entries))
+
+    def query(self, sql, params=()):
+        with self.lock: return self.conn.execute(sql, params).fetchall()
+
+    def top(self, limit, mode=None):
+        if mode is None:
+            rows=self.query(f"SELECT {self.COLUMNS} FROM scores ORDER BY score DESC, id LIMIT ?", (limit,))
+        else:
+            rows=self.query(f"SELECT {self.COLUMNS} FROM scores WHERE mode = ? ORDER BY score DESC, id LIMIT ?", (mode, limit))
+        return [self.row_to_entry(row) for row in rows]
+
+    def personal_best(self, name, mode=None):
+        if mode is None:
+            rows=self.query(f"SELECT {self.COLUMNS} FROM scores WHERE name = ? ORDER BY score DESC LIMIT 1", (name,))
+        else:
+            rows=self.query(f"SELECT {self.COLUMNS} FROM scores WHERE name = ? AND mode = ? ORDER BY score DESC LIMIT 1", (name, mode))
+        return self.row_to_entry(rows[0]) if rows else None
+
+    def count(self, mode=None):
+        if mode is None: return self.query("SELECT COUNT(*) FROM scores")[0][0]
+        return self.query("SELECT COUNT(*) FROM scores WHERE mode = ?", (mode,))[0][0]
+
+    def iter_scores(self, batch_size=10000):
+        # A blocchi sull'id, per non tenere il lock (e la memoria) per tutta la tabella
+        last_id=0
+        while True:
+            rows=self.query("SELECT id, score, mode FROM scores WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+            if not rows: return
+            for last_id, score, mode in rows: yield score, mode
+
+    def iter_entries(self, batch_size=10000):
+        # Tutte le voci in ordine di inserimento, a blocchi come iter_scores
+        last_id=0
+        while True:
+            rows=self.query(f"SELECT id, {self.COLUMNS} FROM scores WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+            if not rows: return
+            last_id=rows[-1][0]
+            for row in rows: yield self.row_to_entry(row[1:])
+
+    def page(self, offset, limit, mode=None, after=None, before=None):
+        # Con after/before (punteggio, id) la pagina si legge direttamente dall'indice
+        # partendo da quella chiave; OFFSET (che scorre tutte le righe saltate) resta solo
+        # per i salti. La forma "score <= ? AND (...)" permette a SQLite una ricerca per intervallo.
+        where=[]; params=[]; order="score DESC, id"
+        if mode is not None: where.append("mode = ?"); params.append(mode)
+        if after is not None:
+            where.append("score <= ? AND (score < ? OR id > ?)"); params.extend((after[0], after[0], after[1]))
+        elif before is not None:
+            where.append("score >= ? AND (score > ? OR id < ?)"); params.extend((before[0], before[0], before[1]))
+            order="score, id DESC"
+        sql=f"SELECT id, {self.COLUMNS} FROM scores"
+        if where: sql+=" WHERE "+" AND ".join(where)
+        sql+=f" ORDER BY {order} LIMIT ?"; params.append(limit)
+        if after is None and before is None: sql+=" OFFSET ?"; params.append(offset)
+        rows=self.query(sql, params)
+        if before is not None: rows.reverse()
+        return [((row[2], row[0]), self.row_to_entry(row[1:])) for row in rows]
+
+    def position(self, name, mode=None):
+        if mode is None: rows=self.query("SELECT score, id FROM scores WHERE name = ? ORDER BY score DESC, id LIMIT 1", (name,))
+        else: rows=self.query("SELECT score, id FROM scores WHERE name = ? AND mode = ? ORDER BY score DESC, id LIMIT 1", (name, mode))
+        if not rows: return None
+        score, row_id = rows[0]
+        if mode is None: return self.query("SELECT COUNT(*) FROM scores WHERE score >= ? AND (score > ? OR id < ?)", (score, score, row_id))[0][0]
+        return self.query("SELECT COUNT(*) FROM scores WHERE mode = ? AND score >= ? AND (score > ? OR id < ?)", (mode, score, score, row_id))[0][0]
+
+    def count_at_least(self, score, mode=None):
+        if mode is None: return self.query("SELECT COUNT(*) FROM scores WHERE score >= ?", (score,))[0][0]
+        return self.query("SELECT COUNT(*) FROM scores WHERE mode = ? AND score >= ?", (mode, score))[0][0]
+
+    def get_meta(self, key):
+        rows=self.query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def set_meta(self, key, value):
+        with self.lock, self.conn: self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def change_token(self):
+        return file_token(self.path, self.path+"-wal")
+
+    def close(self):
+        with self.lock: self.conn.close()
+
+
+def migrate_json_to_sqlite(json_path, store):
+    # Importa una sola volta il vecchio leaderboard.json nel database (il file resta
+    # intatto); restituisce il numero di punteggi importati.
+    if store.get_meta("migrated_json") is not None or not os.path.exists(json_path): return 0
+    try:
+        with open(json_path,'r') as f: data=json.load(f)
+    except(IOError,ValueError): data=[]
+    entries=[entry for entry in data if is_valid_entry(entry)] if isinstance(data,list) else []
+    store.add_entries(entries)
+    store.set_meta("migrated_json", os.path.abspath(json_path))
+    return len(entries)
+
+
+def open_leaderboard(backend, json_path, db_path, max_entries):
+    if backend == BACKEND_SQLITE:
+        store=SqliteLeaderboard(db_path)
+        migrate_json_to_sqlite(json_path, store)
+        return store
+    if backend == BACKEND_JSON: return JsonLeaderboard(json_path, max_entries)
+    raise ValueError(f"Backend leaderboard sconosciuto: {backend}")
+
+
+class LeaderboardPager:
+    # Vista a pagine di una classifica (anche milioni di righe): si leggono solo le pagine
+    # che servono per la finestra visibile e se ne tengono al massimo max_pages (LRU), quindi
+    # memoria e lavoro per frame non dipendono dalla dimensione della tabella. Scorrendo, la
+    # pagina nuova riparte dalla chiave di confine di quella accanto già letta.
+    # pending (opzionale) restituisce le voci accodate ma non ancora scritte nel backend: sono
+    # poche e vengono inserite al loro posto sopra le pagine lette, così la vista è aggiornata
+    # senza aspettare il thread di scrittura.
+    def __init__(self, backend, mode=None, page_size=50, max_pages=8, pending=None):
+        self.backend=backend; self.mode=mode; self.pending=pending
+        self.page_size=page_size; self.max_pages=max_pages
+        self.pages=OrderedDict(); self.total=None; self.known_token=None
+
+    def _refresh_if_changed(self):
+        token=self.backend.change_token()
+        if token != self.known_token: self.pages.clear(); self.total=None; self.known_token=token
+
+    def _pending_entries(self):
+        # Ordinate come le righe del backend: a pari punteggio la voce più recente va dopo
+        return sort_entries(self.pending()) if self.pending else []
+
+    def count(self):
+        pending=self._pending_entries(); self._refresh_if_changed()
+        if self.total is None: self.total=self.backend.count(self.mode)
+        return self.total+len(pending)
+
+    def _page(self, number):
+        rows=self.pages.get(number)
+        if rows is not None: self.pages.move_to_end(number); return rows
+        previous=self.pages.get(number-1); following=self.pages.get(number+1); after=before=None
+        if previous is not None and len(previous)==self.page_size: after=previous[-1][0]
+        elif following: before=following[0][0]
+        rows=self.backend.page(number*self.page_size, self.page_size, self.mode, after, before)
+        self.pages[number]=rows
+        if len(self.pages) > self.max_pages: self.pages.popitem(last=False)
+        return rows
+
+    def rows(self, start, count):
+        # Voci delle righe [start, start+count) come (riga, voce), voci in attesa comprese.
+        # Con k voci in attesa la riga i del backend finisce tra i e i+k: basta leggere il
+        # backend da start-k e contare quante voci in attesa la precedono.
+        pending=self._pending_entries() # Prima del controllo del file: vedi _merge_pending
+        self._refresh_if_changed()
+        if not pending: return self._backend_rows(start, count)
+        start=max(0, start); low=max(0, start-len(pending))
+        window=self._backend_rows(low, start+count-low)
+        return self._merge_pending(window, pending, low, start, start+count)
+
+    def _merge_pending(self, window, pending, low, start, end):
+        # Una voce appena scritta può essere ancora in pending quando il backend la contiene
+        # già: si salta (è uguale alla riga letta)
+        entries=[entry for _, entry in window]
+        pending=[entry for entry in pending if entry not in entries]
+        merged=[(row+sum(1 for entry in pending if entry["score"] > backend_entry["score"]), backend_entry) for row, backend_entry in window]
+        complete=len(window) < end-low # Il backend finisce dentro la finestra
+        for j, entry in enumerate(pending):
+            # Righe del backend con punteggio >= del suo: prima della finestra lo sono tutte,
+            # salvo quando la voce sta più in alto della finestra (allora cade prima di start)
+            if low and (not entries or entry["score"] > entries[0]["score"]): continue
+            at_least=sum(1 for backend_entry in entries if backend_entry["score"] >= entry["score"])
+            if at_least == len(entries) and not complete: continue # Cade dopo la finestra
+            merged.append((j+low+at_least, entry))
+        merged.sort(key=lambda item: item[0])
+        return [(row, entry) for row, entry in merged if start <= row < end]
+
+    def _backend_rows(self, start, count):
+        result=[]; position=max(0, start); end=start+count
+        while position < end:
+            number, first = divmod(position, self.page_size)
+            rows=self._page(number)[first:first+end-position]
+            if not rows: break
+            result.extend((position+i, entry) for i, (_, entry) in enumerate(rows))
+            position+=len(rows)
+            if first+len(rows) < self.page_size: break # Ultima pagina
+        return result
+
+    def position_of(self, name):
+        position=self.backend.position(name, self.mode); pending=self._pending_entries()
+        if position is not None and pending:
+            best=self.backend.personal_best(name, self.mode)["score"]
+            position+=sum(1 for entry in pending if entry["score"] > best)
+        for j, entry in enumerate(pending):
+            if entry["name"]==name:
+                row=j+self.backend.count_at_least(entry["score"], self.mode)
+                if position is None or row < position: position=row
+                break # Le successive hanno punteggio più basso
+        return position
+
+
+class LeaderboardService:
+    # Cache in memoria davanti a un backend, con scrittura differita (write-behind).
+    # - Le letture arrivano dalla cache; un os.stat controlla mtime/dimensione del file e se
+    #   qualcun altro lo ha modificato la cache viene ricaricata.
+    # - add_entry aggiorna subito la cache e accoda la scrittura a un thread dedicato: chi
+    #   conferma il nome non aspetta mai il disco.
+    # - I punteggi accodati ma non ancora scritti vengono uniti anche alle ricariche.
+    # - record_score registra il risultato di ogni partita nell'indice delle posizioni, che
+    #   viene caricato e risalvato dallo stesso thread (più salvataggi in coda diventano uno solo).
+    #   L'indice conta ogni partita conclusa, non solo le voci salvate in classifica; se il file
+    #   manca lo si ricostruisce dai punteggi del backend, l'unico storico disponibile, e da lì
+    #   in poi si torna a contare ogni partita.
+    LOAD_RANKS=object(); SAVE_RANKS=object() # Segnaposti nella coda di scrittura
+
+    def __init__(self, backend, rank_index_path=None):
+        self.backend=backend
+        self.lock=threading.Lock()
+        self.cache={} # (limite, modalità) -> voci ordinate
+        self.known_token=None; self.pending=[]
+        self.rank_index_path=rank_index_path; self.rank_index=None; self.ranks_dirty=False
+        self.unindexed=[] # (punteggio, modalità) delle partite finite prima che l'indice fosse pronto
+        self.write_queue=queue.Queue()
+        if rank_index_path is not None: self.write_queue.put(self.LOAD_RANKS) # Prima di ogni scrittura
+        self.writer=threading.Thread(target=self._writer_loop, name="leaderboard-writer", daemon=True)
+        self.writer.start()
+
+    def _refresh_if_changed(self):
+        token=self.backend.change_token()
+        if token != self.known_token: self.cache.clear(); self.known_token=token
+
+    def top(self, limit, mode=None):
+        with self.lock:
+            self._refresh_if_changed()
+            key=(limit, mode); entries=self.cache.get(key)
+            if entries is None:
+                entries=self.backend.top(limit, mode)
+                for entry in self.pending:
+                    if (mode is None or entry.get("mode")==mode) and entry not in entries: entries.append(entry)
+                entries=sort_entries(entries)[:limit]; self.cache[key]=entries
+            return list(entries)
+
+    def add_entry(self, entry):
+        with self.lock:
+            self.pending.append(entry)
+            for (limit, mode), entries in self.cache.items():
+                if mode is None or entry.get("mode")==mode:
+                    entries.append(entry); entries[:]=sort_entries(entries)[:limit]
+        self.write_queue.put(entry)
+
+    def pager(self, mode=None, page_size=50):
+        # La vista legge dal backend e aggiunge le voci non ancora scritte: aprirla subito
+        # dopo add_entry non aspetta il disco
+        return LeaderboardPager(self.backend, mode, page_size, pending=lambda: self.pending_entries(mode))
+
+    def pending_entries(self, mode=None):
+        with self.lock: return [entry for entry in self.pending if mode is None or entry.get("mode")==mode]
+
+    def _load_rank_index(self):
+        # Sul thread di scrittura, appena creato il servizio: caricare (o ricostruire scorrendo
+        # tutto il backend) non blocca mai la schermata di fine partita
+        index=score_index.ScoreRankIndex.load(self.rank_index_path); rebuilt=index is None
+        if rebuilt:
+            try: index=score_index.ScoreRankIndex.build(self.rank_index_path, self.backend.iter_scores())
+            except (OSError, sqlite3.Error) as e:
+                print(f"Errore ricostruzione indice posizioni: {e}"); index=score_index.ScoreRankIndex(self.rank_index_path)
+        with self.lock:
+            for score, mode in self.unindexed: index.add_score(score, mode)
+            if rebuilt or self.unindexed: self._queue_rank_save()
+            self.rank_index=index; self.unindexed=[]
+
+    def _queue_rank_save(self):
+        if not self.ranks_dirty:
+            self.ranks_dirty=True; self.write_queue.put(self.SAVE_RANKS)
+
+    def record_score(self, score, mode=None):
+        # Registra una partita conclusa e restituisce (posizione, totale, percentuale "top x%")
+        # nella modalità indicata; None se il servizio non ha un indice delle posizioni o se
+        # non è ancora pronto (in quel caso la partita viene contata appena lo è)
+        if self.rank_index_path is None: return None
+        with self.lock:
+            index=self.rank_index
+            if index is None: self.unindexed.append((score, mode)); return None
+            index.add_score(score, mode); self._queue_rank_save()
+            return index.rank(score, mode), index.total(mode), index.percentile(score, mode)
+
+    def rank(self, score, mode=None):
+        # Posizione che il punteggio avrebbe, senza registrarlo
+        if self.rank_index_path is None: return None
+        with self.lock:
+            index=self.rank_index
+            if index is None: return None
+            return index.rank(score, mode), index.total(mode), index.percentile(score, mode)
+
+    def _save_rank_index(self):
+        with self.lock:
+            data=self.rank_index.to_bytes(); self.ranks_dirty=False
+        try: self.rank_index.save(data=data)
+        except OSError as e: print(f"Errore salvataggio indice posizioni: {e}")
+
+    def _writer_loop(self):
+        while True:
+            entry=self.write_queue.get()
+            try:
+                if entry is None: return
+                if entry is self.LOAD_RANKS: self._load_rank_index(); continue
+                if entry is self.SAVE_RANKS: self._save_rank_index(); continue
+                try: self.backend.add_entry(entry)
+                except (OSError, sqlite3.Error) as e: print(f"Errore salvataggio leaderboard: {e}")
+                with self.lock:
+                    self.pending.remove(entry)
+                    # La modifica al file l'abbiamo fatta noi: la cache è già aggiornata
+                    self.known_token=self.backend.change_token()
+            finally: self.write_queue.task_done()
+
+    def flush(self):
+        self.write_queue.join()
+
+    def close(self):
+        if self.writer.is_alive():
+            self.write_queue.put(None); self.writer.join()
+        self.backend.close()
@@ -1,11 +1,19 @@
+import time
+startup_t0=time.perf_counter() # Prima degli import: i tempi di avvio includono anche pygame
 import pygame
-import random
 import sys
 import os
 import json
-
-pygame.init()
-pygame.mixer.init()
+import argparse
+import atexit
+import platform
+from collections import OrderedDict
+import audio
+import controls
+import leaderboard_store
+import replay
+import rewind
+from snake_engine import SnakeEngine, OPPOSITE, EVENT_EAT, EVENT_DEATH, EVENT_WIN, CELL_EMPTY, CELL_SNAKE, MODE_BORDERLESS
 
 # --- Costanti e Configurazioni ---
 SCREEN_WIDTH = 800
@@ -23,201 +31,578 @@ MENU_TEXT_COLOR=(200,200,200); MENU_BUTTON_COLOR=(70,70,70)
 MENU_BUTTON_HOVER_COLOR=(100,100,100); INPUT_BOX_COLOR_ACTIVE=(200,200,200)
 TEXT_INPUT_COLOR=BLACK; PAUSE_OVERLAY_COLOR=(0,0,0,180)
 OBSTACLE_COLOR = (100, 100, 100) # Colore per gli ostacoli
-
-UP=(0,-1); DOWN=(0,1); LEFT=(-1,0); RIGHT=(1,0)
+GHOST_COLOR=(200,200,255); GHOST_ALPHA=120 # Snake fantasma, disegnato trasparente sopra la partita
 
 INITIAL_FPS=8; MAX_FPS=50; FPS_INCREMENT_PER_FOOD=0.5; UI_FPS=15
+REWIND_KEY=pygame.K_BACKSPACE; REWIND_TICKS_PER_TICK=2 # Tenendo premuto si torna indietro a velocità doppia
+# Simulazione a passo fisso: i tick avvengono a current_game_fps (curva di difficoltà sopra)
+# indipendentemente dai frame, disegnati a RENDER_FPS con il movimento tra un tick e l'altro
+DEFAULT_RENDER_FPS=60; RENDER_FPS=0 # 0: frequenza dello schermo, letta da bootstrap
+INTERPOLATE_MOTION=True
+TURBO_KEY=pygame.K_t; TURBO_MULTIPLIER=4 # Turbo: la simulazione va più veloce, i frame in eccesso si saltano
+MAX_TICKS_PER_FRAME=64; MAX_FRAME_TIME=0.25 # Oltre, il ritardo accumulato si scarta (niente raffiche di tick)
+REWIND_CAPACITY=rewind.REWIND_CAPACITY # Tick annullabili uno per uno (memoria fissa, vedi rewind.py)
+TEXT_CACHE_SIZE=256 # Scritte renderizzate tenute in cache (LRU)
+LEADERBOARD_ROW_HEIGHT=34; LEADERBOARD_LIST_TOP=150; LEADERBOARD_PAGE_SIZE=50
+LEADERBOARD_ROW_CACHE_SIZE=64 # Righe della classifica già composte (LRU)
+LEADERBOARD_TABS=(("Tutte",None),("Classica","CLASSIC"),("Ostacoli","OBSTACLES"),("Libera","BORDERLESS"))
+UI_IDLE_MODE=True; UI_IDLE_WAIT_MS=500 # Menu a eventi: senza input si dorme in pygame.event.wait
 
 LEADERBOARD_FILE="leaderboard.json"; MAX_LEADERBOARD_ENTRIES=10; MAX_NAME_LENGTH=10
+LEADERBOARD_DB_FILE="leaderboard.db"; LEADERBOARD_BACKEND=leaderboard_store.BACKEND_JSON # "json" o "sqlite" (storico completo)
+RANK_INDEX_FILE="leaderboard.ranks" # Posizione di ogni partita tra tutte quelle giocate (score_index.py)
+RECORD_REPLAYS=False; REPLAY_DIR="replays" # Con --record-replays ogni partita viene salvata in replays/ (replay.py)
+GHOST_RACING=False # Sfida al fantasma: si gioca con il seme del miglior replay della modalità, che corre accanto
+CACHE_DIR=".pysnake_cache"; FONT_PATH_CACHE_FILE=os.path.join(CACHE_DIR,"font_paths.json")
+AUDIO_CACHE_DIR=os.path.join(CACHE_DIR,"audio"); AUDIO_BUFFER_SIZE=audio.AUDIO_BUFFER_SIZE
+SOUND_FILES={"eat":"eat.mp3","game_over":"game_over.mp3"}
+SOUND_SETTINGS={"eat":("gameplay",1),"game_over":("jingle",2)} # nome: (categoria, priorità)
 NUM_RANDOM_OBSTACLES = 10 # Numero di ostacoli da generare in modalità ostacoli
 
 # --- Variabili Globali di Stato ---
-top_score_value=0; leaderboard_data=[]; current_score_for_name_entry=0
+top_score_value=0; leaderboard_data=[]; current_score_for_name_entry=0; last_game_rank=None
+last_player_name=None # Ultimo nome inserito: serve a "La mia posizione" nella classifica
+last_game_replay=None # File del replay dell'ultima partita (None se non registrata)
 game_state="MENU" # Stati: "MENU", "SELECT_MODE", "GAME", "LEADERBOARD", "SETTINGS", "ENTER_NAME"
 current_game_mode = "CLASSIC" # Modalità: "CLASSIC", "OBSTACLES", "BORDERLESS"
 
-try:
-    screen=pygame.display.set_mode((SCREEN_WIDTH,SCREEN_HEIGHT))
-    pygame.display.set_caption('PySnake by ManiDiAmarena')
-    clock=pygame.time.Clock()
-except Exception as e: print(f"CRITICAL ERROR initializing screen or clock: {e}"); pygame.quit(); sys.exit()
-
-# Font (invariati, tranne aggiunta per titolo sottomenu)
-try:
-    font_style_panel=pygame.font.SysFont("verdana",20); score_font_panel=pygame.font.SysFont("arialblack",24)
-    game_over_font_big=pygame.font.SysFont("impact",50); game_over_font_small=pygame.font.SysFont("verdana",22)
-    menu_font_title=pygame.font.SysFont("impact",60); menu_font_options=pygame.font.SysFont("verdana",30)
-    input_font=pygame.font.SysFont("verdana",28); pause_menu_font=pygame.font.SysFont("verdana",35)
-    submenu_font_title = pygame.font.SysFont("impact", 45) # Font per titoli sottomenu
-except pygame.error as e: # Fallback
-    print(f"Attenzione: Errore caricamento font ({e}). Uso default."); font_style_panel=pygame.font.SysFont(None,25)
-    score_font_panel=pygame.font.SysFont(None,30); game_over_font_big=pygame.font.SysFont(None,55)
-    game_over_font_small=pygame.font.SysFont(None,28); menu_font_title=pygame.font.SysFont(None,65)
-    menu_font_options=pygame.font.SysFont(None,35); input_font=pygame.font.SysFont(None,32)
-    pause_menu_font=pygame.font.SysFont(None,40); submenu_font_title = pygame.font.SysFont(None, 50)
-
-
-current_volume=0.5; eat_sound=None; game_over_sound=None
-# ... (load_sounds, load_leaderboard, add_entry_to_leaderboard, check_if_qualifies invariate) ...
-def load_sounds():
-    global eat_sound,game_over_sound,current_volume
+screen=None; clock=None # Creati da bootstrap(): importare il modulo non apre finestre
+
+# --- Avvio esplicito e misurazione dei tempi ---
+startup_timings=[("import moduli",time.perf_counter()-startup_t0)]; startup_report_pending=False
+
+def mark_startup_phase(phase,phase_start):
+    startup_timings.append((phase,time.perf_counter()-phase_start))
+
+def report_startup_times():
+    print("Tempi di avvio:")
+    for phase,elapsed in startup_timings: print(f"  {phase:<24} {elapsed*1000:8.1f} ms")
+    print(f"  {'primo frame del menu':<24} {(time.perf_counter()-startup_t0)*1000:8.1f} ms (dal lancio)")
+
+def bootstrap():
+    global screen,clock,RENDER_FPS
+    audio.pre_init_mixer(AUDIO_BUFFER_SIZE)
+    t=time.perf_counter(); pygame.init(); mark_startup_phase("pygame.init",t)
+    t=time.perf_counter(); pygame.mixer.init(); sound_manager.init_channels(); mark_startup_phase("pygame.mixer.init",t)
+    try:
+        t=time.perf_counter()
+        screen=pygame.display.set_mode((SCREEN_WIDTH,SCREEN_HEIGHT))
+        pygame.display.set_caption('PySnake by ManiDiAmarena')
+        clock=pygame.time.Clock(); mark_startup_phase("finestra",t)
+    except Exception as e: print(f"CRITICAL ERROR initializing screen or clock: {e}"); pygame.quit(); sys.exit()
+    if not RENDER_FPS: RENDER_FPS=detect_refresh_rate()
+
+def detect_refresh_rate():
+    # Frequenza dello schermo dove disponibile (pygame-ce), altrimenti DEFAULT_RENDER_FPS
+    get_rate=getattr(pygame.display,"get_current_refresh_rate",None)
+    try: rate=get_rate() if get_rate else 0
+    except pygame.error: rate=0
+    return rate if rate>0 else DEFAULT_RENDER_FPS
+
+# --- Font caricati alla prima richiesta ---
+# Ogni SysFont può far partire una scansione dei font di sistema: i percorsi dei file già
+# risolti vengono salvati in FONT_PATH_CACHE_FILE e ai lanci successivi si apre direttamente
+# il file con pygame.font.Font, senza scansione.
+FONT_SPECS={ # nome: (font di sistema, dimensione, dimensione di fallback)
+    "font_style_panel":("verdana",20,25), "score_font_panel":("arialblack",24,30),
+    "game_over_font_big":("impact",50,55), "game_over_font_small":("verdana",22,28),
+    "menu_font_title":("impact",60,65), "menu_font_options":("verdana",30,35),
+    "input_font":("verdana",28,32), "pause_menu_font":("verdana",35,40),
+    "submenu_font_title":("impact",45,50), # Font per titoli sottomenu
+}
+
+def load_font_path_cache():
     try:
-        eat_sound=pygame.mixer.Sound("eat.mp3"); game_over_sound=pygame.mixer.Sound("game_over.mp3")
-        if eat_sound: eat_sound.set_volume(current_volume)
-        if game_over_sound: game_over_sound.set_volume(current_volume)
-    except pygame.error as e: print(f"Errore caricamento audio: {e}"); eat_sound=None; game_over_sound=None
+        with open(FONT_PATH_CACHE_FILE,'r') as f: data=json.load(f)
+        return data if isinstance(data,dict) else {}
+    except(IOError,ValueError): return {}
 
-def load_leaderboard():
-    if not os.path.exists(LEADERBOARD_FILE): return []
+def save_font_path_cache(paths):
     try:
-        with open(LEADERBOARD_FILE,'r') as f: data=json.load(f)
-        if not isinstance(data,list): return []
-        valid_entries=[]
-        for entry in data:
-            if isinstance(entry,dict) and "name" in entry and "score" in entry and \
-               isinstance(entry["name"],str) and isinstance(entry["score"],int): valid_entries.append(entry)
-        return sorted(valid_entries,key=lambda x:x["score"],reverse=True)[:MAX_LEADERBOARD_ENTRIES]
-    except(IOError,ValueError,json.JSONDecodeError): return []
-
-def add_entry_to_leaderboard(name,score_val):
-    leaderboard=load_leaderboard(); leaderboard.append({"name":name,"score":int(score_val)})
-    leaderboard=sorted(leaderboard,key=lambda x:x["score"],reverse=True)[:MAX_LEADERBOARD_ENTRIES]
+        os.makedirs(CACHE_DIR,exist_ok=True)
+        with open(FONT_PATH_CACHE_FILE,'w') as f: json.dump(paths,f,indent=2)
+    except IOError: print(f"Errore salvataggio cache font: {FONT_PATH_CACHE_FILE}")
+
+class LazyFonts:
+    def __init__(self):
+        self.font_paths=None # nome di sistema -> percorso del file (None se non installato)
+
+    def resolve_path(self,system_name):
+        if self.font_paths is None: self.font_paths=load_font_path_cache()
+        if system_name in self.font_paths:
+            path=self.font_paths[system_name]
+            if path is None or os.path.exists(path): return path
+        path=pygame.font.match_font(system_name) # Qui avviene la scansione dei font di sistema
+        self.font_paths[system_name]=path; save_font_path_cache(self.font_paths)
+        return path
+
+    def __getattr__(self,name):
+        if name not in FONT_SPECS: raise AttributeError(name)
+        system_name,size,fallback_size=FONT_SPECS[name]
+        t=time.perf_counter()
+        try: font=pygame.font.Font(self.resolve_path(system_name),size)
+        except(pygame.error,OSError) as e: # Fallback
+            print(f"Attenzione: Errore caricamento font ({e}). Uso default."); font=pygame.font.Font(None,fallback_size)
+        if startup_report_pending: mark_startup_phase(f"font {name}",t)
+        setattr(self,name,font); return font
+
+fonts=LazyFonts()
+
+current_volume=0.5; sound_loader=None
+sound_manager=audio.SoundManager(master_volume=current_volume)
+# I suoni arrivano dal thread di caricamento: fino ad allora play() non fa nulla
+def on_sound_loaded(name,sound):
+    category,priority=SOUND_SETTINGS[name]
+    sound_manager.register(name,sound,category,priority)
+
+def load_sounds():
+    global sound_loader
+    sound_loader=audio.BackgroundSoundLoader(SOUND_FILES,AUDIO_CACHE_DIR,on_sound_loaded); sound_loader.start()
+
+# --- Leaderboard: backend JSON (storico) o SQLite, vedi leaderboard_store.py ---
+# Letture dalla cache in memoria del servizio, scritture su disco in un thread separato
+leaderboard_service=None
+game_input=None # Comandi di direzione (controls.py), creati alla prima partita
+INPUT_LATENCY_REPORT=False; INPUT_LATENCY_FILE="input_latency.json" # Ritardi dei comandi, esportati all'uscita
+
+def get_leaderboard_service():
+    global leaderboard_service
+    if leaderboard_service is None:
+        backend=leaderboard_store.open_leaderboard(LEADERBOARD_BACKEND,LEADERBOARD_FILE,LEADERBOARD_DB_FILE,MAX_LEADERBOARD_ENTRIES)
+        leaderboard_service=leaderboard_store.LeaderboardService(backend,RANK_INDEX_FILE)
+        atexit.register(leaderboard_service.close) # Completa le scritture in coda prima di uscire
+    return leaderboard_service
+
+def get_game_input():
+    global game_input
+    if game_input is None:
+        game_input=controls.GameInput()
+        if INPUT_LATENCY_REPORT: atexit.register(write_input_latency_report,latency_report_info())
+    return game_input
+
+def latency_report_info():
+    # Letta subito: all'uscita pygame è già chiuso
+    return {"created":time.strftime("%Y-%m-%d %H:%M:%S"),"platform":platform.platform(),"python":platform.python_version(),
+            "pygame":pygame.version.ver,"sdl":".".join(map(str,pygame.get_sdl_version())),"video_driver":pygame.display.get_driver(),
+            "render_fps":RENDER_FPS,"interpolation":INTERPOLATE_MOTION,"queue_size":game_input.queue.capacity}
+
+def write_input_latency_report(info):
+    print(game_input.summary())
+    try: game_input.write_report(INPUT_LATENCY_FILE,info); print(f"Istogrammi dei ritardi salvati in {INPUT_LATENCY_FILE}")
+    except OSError as e: print(f"Errore salvataggio {INPUT_LATENCY_FILE}: {e}")
+
+def load_leaderboard():
+    return get_leaderboard_service().top(MAX_LEADERBOARD_ENTRIES)
+
+def add_entry_to_leaderboard(name,score_val,mode=None,replay_file=None,length=None):
+    get_leaderboard_service().add_entry(leaderboard_store.make_entry(name,score_val,mode,replay=replay_file,length=length))
+
+# --- Replay: seme e cambi di direzione di ogni partita, vedi replay.py ---
+def start_replay_recording(engine):
+    if not RECORD_REPLAYS: return None
+    file_name=f"{engine.mode.lower()}_{time.strftime('%Y%m%d_%H%M%S')}_{engine.seed:016x}{replay.REPLAY_EXTENSION}"
     try:
-        with open(LEADERBOARD_FILE,'w') as f: json.dump(leaderboard,f,indent=2)
-    except IOError: print(f"Errore salvataggio leaderboard: {LEADERBOARD_FILE}")
+        os.makedirs(REPLAY_DIR,exist_ok=True)
+        return replay.ReplayWriter(os.path.join(REPLAY_DIR,file_name),replay.ReplayHeader.from_engine(engine))
+    except OSError as e: print(f"Errore registrazione replay: {e}"); return None
+
+def open_ghost_replay(mode):
+    # Fantasma per la sfida: il replay del miglior punteggio della modalità che è ancora in
+    # REPLAY_DIR ed è stato giocato sulla stessa griglia. Viene letto man mano (ReplayPlayer).
+    for entry in get_leaderboard_service().top(MAX_LEADERBOARD_ENTRIES,mode):
+        if not entry.get("replay"): continue
+        try: reader=replay.ReplayReader(os.path.join(REPLAY_DIR,os.path.basename(entry["replay"])))
+        except (OSError,replay.ReplayError): continue
+        header=reader.header
+        if header.mode==mode and (header.grid_width,header.grid_height,header.num_obstacles)==(GRID_WIDTH,GRID_HEIGHT,NUM_RANDOM_OBSTACLES):
+            return replay.ReplayPlayer(reader)
+        reader.close()
+    return None
+
+def finish_replay_recording(recorder,engine):
+    # Restituisce il nome del file del replay completato (None se non registrato)
+    if recorder is None: return None
+    try: recorder.finish(engine.tick,engine.score,engine.snake_length)
+    except OSError as e: print(f"Errore registrazione replay: {e}"); recorder.abort(); return None
+    return os.path.basename(recorder.path)
 
 def check_if_qualifies(score_val,leaderboard):
     if len(leaderboard)<MAX_LEADERBOARD_ENTRIES: return True
     if not leaderboard: return True
     return score_val > leaderboard[-1]["score"]
 
+def record_game_result(score_val,mode=None):
+    # Ogni partita conclusa entra nell'indice delle posizioni: (posizione, totale, top %)
+    try: return get_leaderboard_service().record_score(score_val,mode)
+    except (OSError,ValueError) as e: print(f"Errore indice posizioni: {e}"); return None
+
+def format_rank_line(rank_info):
+    if not rank_info: return ""
+    rank,total,percentile=rank_info
+    top=f"{percentile:.1f}" if percentile<10 else f"{percentile:.0f}"
+    return f"Posizione #{rank:,} su {total:,} (top {top}%)".replace(",",".")
+
+# --- Cache LRU delle scritte renderizzate ---
+# Le stesse scritte (titoli, pulsanti, pannello, righe della classifica) vengono
+# ridisegnate a ogni frame: si rasterizzano una volta e si riusano finché restano tra le
+# TEXT_CACHE_SIZE usate più di recente. hits/misses permettono di verificarlo.
+class TextRenderCache:
+    def __init__(self,max_entries):
+        self.max_entries=max_entries; self.entries=OrderedDict(); self.hits=0; self.misses=0
+
+    def render(self,font,text,color,antialias=True):
+        return self.cached((font,text,color,antialias),lambda: font.render(text,antialias,color))
+
+    def cached(self,key,build):
+        # Superficie per la chiave, creata con build() solo se non è già in cache
+        surf=self.entries.get(key)
+        if surf is not None:
+            self.hits+=1; self.entries.move_to_end(key); return surf
+        self.misses+=1
+        surf=build(); self.entries[key]=surf
+        if len(self.entries)>self.max_entries: self.entries.popitem(last=False)
+        return surf
+
+    def stats(self):
+        total=self.hits+self.misses
+        return {"hits":self.hits,"misses":self.misses,"entries":len(self.entries),"hit_rate":self.hits/total if total else 0.0}
+
+text_cache=TextRenderCache(TEXT_CACHE_SIZE)
+
+def render_text(font,text,color,antialias=True):
+    return text_cache.render(font,text,color,antialias)
+
 def display_score_and_highscore_panel(score,high_score_display_val): # Invariata
     pygame.draw.rect(screen,PANEL_COLOR,[0,0,SCREEN_WIDTH,PANEL_HEIGHT])
-    score_text_surface=score_font_panel.render("Punteggio: "+str(score),True,BLUE)
+    score_text_surface=render_text(fonts.score_font_panel,"Punteggio: "+str(score),BLUE)
     screen.blit(score_text_surface,[15,PANEL_HEIGHT//2-score_text_surface.get_height()//2])
-    highscore_text_surface=font_style_panel.render("Top Score: "+str(high_score_display_val),True,YELLOW)
+    highscore_text_surface=render_text(fonts.font_style_panel,"Top Score: "+str(high_score_display_val),YELLOW)
     screen.blit(highscore_text_surface,[SCREEN_WIDTH-highscore_text_surface.get_width()-15,PANEL_HEIGHT//2-highscore_text_surface.get_height()//2])
 
-def draw_snake(snake_list): # Invariata
-    for x,y in snake_list:
-        pygame.draw.rect(screen,GREEN,[x*GRID_SIZE,PANEL_HEIGHT+y*GRID_SIZE,GRID_SIZE,GRID_SIZE])
-        pygame.draw.rect(screen,BLACK,[x*GRID_SIZE,PANEL_HEIGHT+y*GRID_SIZE,GRID_SIZE,GRID_SIZE],1)
-
-def draw_food(food_pos): # Invariata
-    pygame.draw.rect(screen,RED,[food_pos[0]*GRID_SIZE,PANEL_HEIGHT+food_pos[1]*GRID_SIZE,GRID_SIZE,GRID_SIZE])
-    pygame.draw.rect(screen,BLACK,[food_pos[0]*GRID_SIZE,PANEL_HEIGHT+food_pos[1]*GRID_SIZE,GRID_SIZE,GRID_SIZE],1)
+# --- Cache degli sprite delle celle ---
+# Una Surface già bordata per ogni colore di cella e i Rect di tutte le celle della griglia
+# calcolati una volta sola: disegnare un livello è un'unica chiamata blits/fblits.
+cell_sprite_cache={}; cell_rects_cache={}
+
+def get_cell_sprite(color,alpha=None):
+    sprite=cell_sprite_cache.get((color,alpha))
+    if sprite is None:
+        sprite=pygame.Surface((GRID_SIZE,GRID_SIZE)).convert(); sprite.fill(color)
+        pygame.draw.rect(sprite,BLACK,sprite.get_rect(),1) # Bordo
+        if alpha is not None: sprite.set_alpha(alpha) # Trasparenza per superficie: blit senza pixel alpha
+        cell_sprite_cache[(color,alpha)]=sprite
+    return sprite
+
+def get_cell_rects(top=PANEL_HEIGHT):
+    # Rect di ogni cella indicizzati come nel motore (y*GRID_WIDTH+x)
+    rects=cell_rects_cache.get(top)
+    if rects is None:
+        rects=[pygame.Rect(x*GRID_SIZE,top+y*GRID_SIZE,GRID_SIZE,GRID_SIZE) for y in range(GRID_HEIGHT) for x in range(GRID_WIDTH)]
+        cell_rects_cache[top]=rects
+    return rects
+
+def blit_partial_cell(rect,direction,depth,color=GREEN):
+    # Parte di una cella che entra in rect muovendosi in direction: i primi depth pixel dal
+    # lato d'ingresso, con il bordo del fronte visibile. Una coda che esce verso d è una
+    # cella che entra con direzione opposta.
+    sprite=get_cell_sprite(color); dx,dy=direction
+    if dx>0: screen.blit(sprite,(rect.x,rect.y),(GRID_SIZE-depth,0,depth,GRID_SIZE))
+    elif dx<0: screen.blit(sprite,(rect.right-depth,rect.y),(0,0,depth,GRID_SIZE))
+    elif dy>0: screen.blit(sprite,(rect.x,rect.y),(0,GRID_SIZE-depth,GRID_SIZE,depth))
+    else: screen.blit(sprite,(rect.x,rect.bottom-depth),(0,0,GRID_SIZE,depth))
+
+def cell_direction(from_idx,to_idx):
+    # Direzione tra due celle adiacenti, anche attraverso il bordo in modalità libera
+    return ((to_idx%GRID_WIDTH-from_idx%GRID_WIDTH+1)%GRID_WIDTH-1,(to_idx//GRID_WIDTH-from_idx//GRID_WIDTH+1)%GRID_HEIGHT-1)
+
+def draw_cells(cell_indices,color,surface,top=PANEL_HEIGHT,alpha=None):
+    sprite=get_cell_sprite(color,alpha); rects=get_cell_rects(top)
+    blit_sequence=[(sprite,rects[idx]) for idx in cell_indices]
+    if hasattr(surface,"fblits"): surface.fblits(blit_sequence) # pygame-ce
+    else: surface.blits(blit_sequence,doreturn=False)
+
+# Le funzioni di disegno accettano la superficie di destinazione: di default lo schermo
+# (area di gioco sotto il pannello), altrimenti la board persistente del renderer (top=0)
+def draw_snake(snake_list,surface=None,top=PANEL_HEIGHT):
+    draw_cells([y*GRID_WIDTH+x for x,y in snake_list],GREEN,screen if surface is None else surface,top)
+
+def draw_food(food_pos,surface=None,top=PANEL_HEIGHT):
+    draw_cells((food_pos[1]*GRID_WIDTH+food_pos[0],),RED,screen if surface is None else surface,top)
 
 # --- NUOVA Funzione: Disegnare Ostacoli ---
-def draw_obstacles(obstacle_list):
-    for x, y in obstacle_list:
-        pygame.draw.rect(screen, OBSTACLE_COLOR, [x * GRID_SIZE, PANEL_HEIGHT + y * GRID_SIZE, GRID_SIZE, GRID_SIZE])
-        pygame.draw.rect(screen, BLACK, [x * GRID_SIZE, PANEL_HEIGHT + y * GRID_SIZE, GRID_SIZE, GRID_SIZE], 1) # Bordo
-
-def display_message_game_area(msg,color,y_displacement=0,chosen_font=game_over_font_small): # Invariata
-    mesg=chosen_font.render(msg,True,color)
+def draw_obstacles(obstacle_list,surface=None,top=PANEL_HEIGHT):
+    draw_cells([y*GRID_WIDTH+x for x,y in obstacle_list],OBSTACLE_COLOR,screen if surface is None else surface,top)
+
+# --- Renderer incrementale dell'area di gioco ---
+# Tiene una board persistente e a ogni tick ridisegna solo le celle cambiate (nuova testa,
+# coda liberata, cibo) e il pannello se il punteggio cambia, presentando solo quei
+# rettangoli con pygame.display.update(rect_list): il costo non dipende dalla lunghezza
+# dello snake né dal numero di ostacoli.
+# Ostacoli e futura geometria statica sono "cotti" una volta per partita in uno sfondo
+# (background): un ridisegno completo parte da un solo blit e la coda si cancella
+# ricopiando lo sfondo sotto la cella.
+# Lo snake fantasma non entra nella board: è un livello trasparente aggiunto sullo schermo
+# sopra le celle presentate, quindi le sue celle cambiate (testa e coda) sono solo due in più.
+# Tra un tick e l'altro present() può mostrare il movimento in corso (alpha = frazione del
+# tick trascorsa): anche questo solo sullo schermo, sulle due celle di testa e coda.
+class GameAreaRenderer:
+    def __init__(self):
+        self.board=pygame.Surface((SCREEN_WIDTH,GAME_AREA_HEIGHT)).convert()
+        self.background=None; self.background_mode=None
+        self.panel_rect=pygame.Rect(0,0,SCREEN_WIDTH,PANEL_HEIGHT)
+        self.dirty_cells=[]; self.needs_full_redraw=True
+        self.drawn_food_idx=-1; self.drawn_panel=None
+        self.ghost=None # Motore del fantasma (None: nessuno)
+        self.partial_cells=[] # Celle disegnate a metà nell'ultimo frame, da ripristinare dalla board
+
+    def set_ghost(self,ghost_engine):
+        if ghost_engine is not self.ghost: self.ghost=ghost_engine; self.needs_full_redraw=True
+
+    def invalidate(self): # Schermo sovrascritto (pausa, game over)
+        self.needs_full_redraw=True
+
+    def invalidate_background(self): # Restart o cambio modalità: ostacoli nuovi
+        self.background=None; self.needs_full_redraw=True
+
+    def build_background(self,engine):
+        self.background=pygame.Surface((SCREEN_WIDTH,GAME_AREA_HEIGHT)).convert(); self.background.fill(BLACK)
+        if engine.obstacles: draw_obstacles(engine.obstacles,self.background,0)
+        self.background_mode=engine.mode
+
+    def apply_step(self,engine):
+        # Da chiamare dopo ogni engine.step(): aggiorna la board solo dove serve
+        if self.needs_full_redraw: return
+        rects=get_cell_rects(0)
+        if engine.last_tail_idx>=0:
+            rect=rects[engine.last_tail_idx]; self.board.blit(self.background,rect,rect); self.dirty_cells.append(engine.last_tail_idx)
+        head_idx=engine.body[-1]
+        self.board.blit(get_cell_sprite(GREEN),rects[head_idx]); self.dirty_cells.append(head_idx)
+        if engine.food_idx!=self.drawn_food_idx:
+            self.drawn_food_idx=engine.food_idx
+            if engine.food_idx>=0:
+                self.board.blit(get_cell_sprite(RED),rects[engine.food_idx]); self.dirty_cells.append(engine.food_idx)
+
+    def apply_ghost_step(self,ghost_engine):
+        # Da chiamare dopo ogni tick del fantasma: le sue celle cambiate vanno ripresentate
+        if self.needs_full_redraw: return
+        if ghost_engine.last_tail_idx>=0: self.dirty_cells.append(ghost_engine.last_tail_idx)
+        self.dirty_cells.append(ghost_engine.body[-1])
+
+    def overlay_ghost(self,idx,screen_rect):
+        ghost=self.ghost
+        if ghost is not None and ghost.grid[idx]==CELL_SNAKE: screen.blit(get_cell_sprite(GHOST_COLOR,GHOST_ALPHA),screen_rect)
+
+    def draw_motion(self,engine,alpha,next_direction):
+        # La testa entra per una frazione alpha nella cella del prossimo tick (direzione già
+        # decisa dall'input, con le stesse regole di step) e la coda esce dalla sua. Se il
+        # prossimo tick è mortale non si disegna niente. Restituisce i rect dello schermo toccati.
+        if next_direction is None or engine.game_over: return ()
+        depth=min(int(alpha*GRID_SIZE),GRID_SIZE)
+        if depth<=0: return ()
+        direction=engine.direction if next_direction==OPPOSITE[engine.direction] else next_direction
+        x=engine.head_x+direction[0]; y=engine.head_y+direction[1]
+        if engine.mode==MODE_BORDERLESS: x%=GRID_WIDTH; y%=GRID_HEIGHT
+        elif not (0<=x<GRID_WIDTH and 0<=y<GRID_HEIGHT): return ()
+        next_idx=y*GRID_WIDTH+x
+        if engine.grid[next_idx]!=CELL_EMPTY: return ()
+        board_rects=get_cell_rects(0); screen_rects=get_cell_rects(); body=engine.body
+        rect=screen_rects[next_idx]; screen.blit(self.board,rect,board_rects[next_idx])
+        blit_partial_cell(rect,direction,depth); self.partial_cells.append(next_idx)
+        if len(body)>=engine.snake_length: # Al prossimo tick la coda si sposta
+            tail_idx=body[0]; rect=screen_rects[tail_idx]; screen.blit(self.background,rect,board_rects[tail_idx])
+            if depth<GRID_SIZE: blit_partial_cell(rect,OPPOSITE[cell_direction(tail_idx,body[1] if len(body)>1 else next_idx)],GRID_SIZE-depth)
+            self.partial_cells.append(tail_idx)
+        for idx in self.partial_cells: self.overlay_ghost(idx,screen_rects[idx])
+        return [screen_rects[idx] for idx in self.partial_cells]
+
+    def present(self,engine,top_score,alpha=0.0,next_direction=None):
+        # alpha e next_direction: frazione del tick in corso e direzione del prossimo tick,
+        # per disegnare il movimento tra i tick (di default lo stato del tick così com'è)
+        if self.needs_full_redraw:
+            if self.background is None or self.background_mode!=engine.mode: self.build_background(engine)
+            self.board.blit(self.background,(0,0))
+            draw_cells(engine.body,GREEN,self.board,0)
+            self.drawn_food_idx=engine.food_idx
+            if engine.food_idx>=0: draw_cells((engine.food_idx,),RED,self.board,0)
+            display_score_and_highscore_panel(engine.score,top_score); self.drawn_panel=(engine.score,top_score)
+            screen.blit(self.board,(0,PANEL_HEIGHT))
+            if self.ghost is not None: draw_cells(self.ghost.body,GHOST_COLOR,screen,PANEL_HEIGHT,GHOST_ALPHA)
+            self.needs_full_redraw=False; self.dirty_cells.clear(); self.partial_cells.clear()
+            self.draw_motion(engine,alpha,next_direction)
+            pygame.display.update(); return
+        update_rects=[]; board_rects=get_cell_rects(0); screen_rects=get_cell_rects()
+        dirty_cells=self.dirty_cells; dirty_cells.extend(self.partial_cells); self.partial_cells.clear()
+        for idx in dirty_cells:
+            screen_rect=screen_rects[idx]; screen.blit(self.board,screen_rect,board_rects[idx])
+            self.overlay_ghost(idx,screen_rect); update_rects.append(screen_rect)
+        dirty_cells.clear()
+        update_rects.extend(self.draw_motion(engine,alpha,next_direction))
+        if self.drawn_panel!=(engine.score,top_score):
+            display_score_and_highscore_panel(engine.score,top_score); self.drawn_panel=(engine.score,top_score)
+            update_rects.append(self.panel_rect)
+        if update_rects: pygame.display.update(update_rects)
+
+def display_message_game_area(msg,color,y_displacement=0,chosen_font=None):
+    if chosen_font is None: chosen_font=fonts.game_over_font_small
+    mesg=render_text(chosen_font,msg,color)
     text_rect=mesg.get_rect(center=(SCREEN_WIDTH/2,PANEL_HEIGHT+GAME_AREA_HEIGHT/2+y_displacement))
     screen.blit(mesg,text_rect)
 
-# --- MODIFICA: get_random_food_position ora considera anche gli ostacoli ---
-def get_random_food_position(snake_list, current_obstacles=None):
-    if current_obstacles is None:
-        current_obstacles = []
-    while True:
-        food_x = random.randrange(0, GRID_WIDTH)
-        food_y = random.randrange(0, GRID_HEIGHT)
-        if (food_x, food_y) not in snake_list and (food_x, food_y) not in current_obstacles:
-            return (food_x, food_y)
-
-# --- NUOVA Funzione: Generare Ostacoli Casuali ---
-def generate_random_obstacles(num_obstacles, snake_start_list):
-    obstacles = []
-    # Definisci un'area sicura attorno alla testa dello snake all'inizio
-    safe_radius = 3 
-    head_x, head_y = snake_start_list[0]
-
-    for _ in range(num_obstacles):
-        while True:
-            obs_x = random.randrange(0, GRID_WIDTH)
-            obs_y = random.randrange(0, GRID_HEIGHT)
-            # Controlla se è troppo vicino alla testa o sullo snake iniziale o già un ostacolo
-            too_close_to_head = abs(obs_x - head_x) < safe_radius and abs(obs_y - head_y) < safe_radius
-            if (obs_x, obs_y) not in snake_start_list and \
-               (obs_x, obs_y) not in obstacles and \
-               not too_close_to_head:
-                obstacles.append((obs_x, obs_y))
-                break
-    return obstacles
-
-
 def draw_button(text,font,text_color,rect,button_color,hover_color): # Invariata
     is_hovered=rect.collidepoint(pygame.mouse.get_pos())
     current_button_color=hover_color if is_hovered else button_color
     pygame.draw.rect(screen,current_button_color,rect,border_radius=10)
-    text_surf=font.render(text,True,text_color)
+    text_surf=render_text(font,text,text_color)
     text_rect=text_surf.get_rect(center=rect.center)
     screen.blit(text_surf,text_rect)
     return is_hovered
 
-# ... (name_input_loop, leaderboard_screen_loop, settings_screen_loop, run_pause_menu invariate rispetto all'ultima versione) ...
-def name_input_loop(achieved_score): # Invariata, usa UI_FPS
-    global game_state,leaderboard_data,top_score_value
+# --- Loop UI guidati dagli eventi ---
+# Con UI_IDLE_MODE i menu restano bloccati in pygame.event.wait finché non arriva un input
+# e ridisegnano solo se è cambiato qualcosa: un evento diverso dal movimento del mouse,
+# il pulsante sotto il cursore o uno stato mostrato a schermo (volume, nome inserito).
+def wait_ui_events(redraw_pending):
+    if not UI_IDLE_MODE or redraw_pending: return pygame.event.get()
+    event=pygame.event.wait(UI_IDLE_WAIT_MS)
+    if event.type==pygame.NOEVENT: return []
+    return [event]+pygame.event.get()
+
+def ui_view_state(button_rects,*extra_state):
+    mouse_pos=pygame.mouse.get_pos()
+    return tuple(rect.collidepoint(mouse_pos) for rect in button_rects)+extra_state
+
+def ui_needs_redraw(events,last_view,view):
+    return view!=last_view or any(event.type!=pygame.MOUSEMOTION for event in events)
+
+def name_input_loop(achieved_score,rank_info=None): # Invariata, usa UI_FPS
+    global game_state,leaderboard_data,top_score_value,last_player_name
     user_name=""; input_box_rect=pygame.Rect(SCREEN_WIDTH//2-150,SCREEN_HEIGHT//2-25,300,50); running=True
-    prompt_surf=menu_font_options.render("Nuovo High Score!",True,YELLOW)
+    prompt_surf=fonts.menu_font_options.render("Nuovo High Score!",True,YELLOW)
     prompt_rect=prompt_surf.get_rect(center=(SCREEN_WIDTH//2,SCREEN_HEIGHT//2-140))
-    instr_surf=font_style_panel.render("Inserisci il tuo nome (max 10 caratteri):",True,WHITE)
+    instr_surf=fonts.font_style_panel.render("Inserisci il tuo nome (max 10 caratteri):",True,WHITE)
     instr_rect=instr_surf.get_rect(center=(SCREEN_WIDTH//2,SCREEN_HEIGHT//2-100))
-    score_surf=font_style_panel.render(f"Punteggio: {achieved_score}",True,WHITE)
+    score_surf=fonts.font_style_panel.render(f"Punteggio: {achieved_score}",True,WHITE)
     score_rect=score_surf.get_rect(center=(SCREEN_WIDTH//2,SCREEN_HEIGHT//2-70))
+    rank_surf=fonts.font_style_panel.render(format_rank_line(rank_info),True,BLUE)
+    rank_rect=rank_surf.get_rect(center=(SCREEN_WIDTH//2,SCREEN_HEIGHT//2+60))
+    last_view=None
     while running:
-        for event in pygame.event.get():
+        events=wait_ui_events(last_view is None)
+        for event in events:
             if event.type==pygame.QUIT: pygame.quit();sys.exit()
             if event.type==pygame.KEYDOWN:
                 if event.key==pygame.K_RETURN:
                     final_name=user_name.strip();
                     if not final_name: final_name="Player"
-                    add_entry_to_leaderboard(final_name,achieved_score); leaderboard_data=load_leaderboard()
+                    replay_file,final_length=last_game_replay or (None,None)
+                    add_entry_to_leaderboard(final_name,achieved_score,current_game_mode,replay_file,final_length); leaderboard_data=load_leaderboard()
+                    last_player_name=final_name
                     if leaderboard_data: top_score_value=leaderboard_data[0]["score"]
                     game_state="LEADERBOARD"; running=False
                 elif event.key==pygame.K_BACKSPACE: user_name=user_name[:-1]
                 elif len(user_name)<MAX_NAME_LENGTH and(event.unicode.isalnum()or event.unicode==' '): user_name+=event.unicode
                 if event.key==pygame.K_ESCAPE: game_state="MENU";running=False
-        screen.fill(BLACK); screen.blit(prompt_surf,prompt_rect); screen.blit(instr_surf,instr_rect); screen.blit(score_surf,score_rect)
-        pygame.draw.rect(screen,INPUT_BOX_COLOR_ACTIVE,input_box_rect,border_radius=5)
-        text_surface=input_font.render(user_name,True,TEXT_INPUT_COLOR)
-        screen.blit(text_surface,(input_box_rect.x+10,input_box_rect.y+(input_box_rect.height-text_surface.get_height())//2))
-        pygame.draw.rect(screen,WHITE,input_box_rect,2,border_radius=5)
-        pygame.display.flip(); clock.tick(UI_FPS)
-
-def leaderboard_screen_loop(): # Invariata, usa UI_FPS
+        if not running: break
+        view=(user_name,)
+        if ui_needs_redraw(events,last_view,view) or not UI_IDLE_MODE:
+            screen.fill(BLACK); screen.blit(prompt_surf,prompt_rect); screen.blit(instr_surf,instr_rect); screen.blit(score_surf,score_rect)
+            if rank_info: screen.blit(rank_surf,rank_rect)
+            pygame.draw.rect(screen,INPUT_BOX_COLOR_ACTIVE,input_box_rect,border_radius=5)
+            text_surface=render_text(fonts.input_font,user_name,TEXT_INPUT_COLOR)
+            screen.blit(text_surface,(input_box_rect.x+10,input_box_rect.y+(input_box_rect.height-text_surface.get_height())//2))
+            pygame.draw.rect(screen,WHITE,input_box_rect,2,border_radius=5)
+            pygame.display.flip(); last_view=view
+        clock.tick(UI_FPS)
+
+# --- Classifica virtualizzata ---
+# Si disegnano solo le righe visibili, lette a pagine dal backend (LeaderboardPager): il
+# costo di un frame e la memoria usata sono gli stessi con 10 righe o con 10 milioni.
+# Ogni riga viene composta in una superficie una volta sola e riusata finché resta in cache.
+leaderboard_row_cache=TextRenderCache(LEADERBOARD_ROW_CACHE_SIZE)
+LEADERBOARD_VISIBLE_ROWS=(SCREEN_HEIGHT-100-LEADERBOARD_LIST_TOP)//LEADERBOARD_ROW_HEIGHT
+
+def render_leaderboard_row(position,entry,highlighted):
+    name_text=entry.get("name","N/A")[:MAX_NAME_LENGTH]; score_text=str(entry.get("score",0))
+    color=YELLOW if highlighted else MENU_TEXT_COLOR
+    def build():
+        font=fonts.game_over_font_small
+        row_surf=pygame.Surface((SCREEN_WIDTH-160,LEADERBOARD_ROW_HEIGHT),pygame.SRCALPHA)
+        rank_surf=font.render(f"{position+1}.",True,color); name_surf=font.render(name_text,True,color)
+        score_surf=font.render(score_text,True,color); middle=LEADERBOARD_ROW_HEIGHT//2
+        row_surf.blit(rank_surf,rank_surf.get_rect(midright=(150,middle)))
+        row_surf.blit(name_surf,name_surf.get_rect(midleft=(170,middle)))
+        row_surf.blit(score_surf,score_surf.get_rect(midright=(row_surf.get_width()-20,middle)))
+        return row_surf
+    return leaderboard_row_cache.cached((position,name_text,score_text,color),build)
+
+def leaderboard_screen_loop(): # Scorrimento: rotella, frecce, PagSu/PagGiù, Home/Fine; schede: Tab o clic
     global game_state,leaderboard_data
-    running=True; back_button_rect=pygame.Rect(SCREEN_WIDTH//2-100,SCREEN_HEIGHT-80,200,50)
+    running=True; back_button_rect=pygame.Rect(SCREEN_WIDTH//2-100,SCREEN_HEIGHT-80,200,50); last_view=None
+    my_rank_rect=pygame.Rect(40,SCREEN_HEIGHT-80,220,50)
+    tab_width=(SCREEN_WIDTH-80-10*(len(LEADERBOARD_TABS)-1))//len(LEADERBOARD_TABS)
+    tab_rects=[pygame.Rect(40+i*(tab_width+10),95,tab_width,36) for i in range(len(LEADERBOARD_TABS))]
+    service=get_leaderboard_service(); visible=LEADERBOARD_VISIBLE_ROWS
+    tab_index=0; pager=service.pager(LEADERBOARD_TABS[0][1],LEADERBOARD_PAGE_SIZE); scroll=0; my_position=None
     while running:
-        mouse_clicked_this_frame=False
-        for event in pygame.event.get():
+        mouse_clicked_this_frame=False; jump_to_me=False; new_tab=None; total=pager.count()
+        events=wait_ui_events(last_view is None)
+        for event in events:
             if event.type==pygame.QUIT: pygame.quit();sys.exit()
-            if event.type==pygame.KEYDOWN and event.key==pygame.K_ESCAPE: running=False;game_state="MENU"
-            if event.type==pygame.MOUSEBUTTONDOWN and event.button==1: mouse_clicked_this_frame=True
-        screen.fill(BLACK)
-        title_surf=menu_font_title.render("Leaderboard",True,YELLOW)
-        screen.blit(title_surf,title_surf.get_rect(center=(SCREEN_WIDTH//2,60)))
-        if not leaderboard_data:
-            no_scores_surf=menu_font_options.render("Nessun punteggio!",True,WHITE)
-            screen.blit(no_scores_surf,no_scores_surf.get_rect(center=(SCREEN_WIDTH//2,SCREEN_HEIGHT//2-50)))
-        else:
-            y_offset=130
-            for i,entry in enumerate(leaderboard_data):
-                name_text=entry.get("name","N/A")[:MAX_NAME_LENGTH];score_text=str(entry.get("score",0))
-                display_text=f"{i+1}. {name_text:<{MAX_NAME_LENGTH+1}} - {score_text:>5}"
-                entry_surf=menu_font_options.render(display_text,True,MENU_TEXT_COLOR)
-                screen.blit(entry_surf,entry_surf.get_rect(midleft=(SCREEN_WIDTH//2-200,y_offset+i*40)))
-                if i>=MAX_LEADERBOARD_ENTRIES-1:break
-        if draw_button("Indietro",menu_font_options,WHITE,back_button_rect,MENU_BUTTON_COLOR,MENU_BUTTON_HOVER_COLOR)and mouse_clicked_this_frame:
-            running=False;game_state="MENU"
-        pygame.display.flip();clock.tick(UI_FPS)
+            if event.type==pygame.KEYDOWN:
+                if event.key==pygame.K_ESCAPE: running=False;game_state="MENU"
+                elif event.key==pygame.K_UP: scroll-=1
+                elif event.key==pygame.K_DOWN: scroll+=1
+                elif event.key==pygame.K_PAGEUP: scroll-=visible
+                elif event.key==pygame.K_PAGEDOWN: scroll+=visible
+                elif event.key==pygame.K_HOME: scroll=0
+                elif event.key==pygame.K_END: scroll=total
+                elif event.key in (pygame.K_TAB,pygame.K_RIGHT): new_tab=(tab_index+1)%len(LEADERBOARD_TABS)
+                elif event.key==pygame.K_LEFT: new_tab=(tab_index-1)%len(LEADERBOARD_TABS)
+                elif event.key==pygame.K_p: jump_to_me=True
+            if event.type==pygame.MOUSEWHEEL: scroll-=3*event.y
+            if event.type==pygame.MOUSEBUTTONDOWN and event.button==1:
+                mouse_clicked_this_frame=True
+                for i,rect in enumerate(tab_rects):
+                    if rect.collidepoint(event.pos): new_tab=i
+                if my_rank_rect.collidepoint(event.pos): jump_to_me=True
+        if not running: break
+        if new_tab is not None and new_tab!=tab_index:
+            tab_index=new_tab; pager=service.pager(LEADERBOARD_TABS[tab_index][1],LEADERBOARD_PAGE_SIZE)
+            scroll=0; my_position=None; total=pager.count()
+        if jump_to_me and last_player_name:
+            my_position=pager.position_of(last_player_name)
+            if my_position is not None: scroll=my_position-visible//2
+        scroll=max(0,min(scroll,total-visible))
+        view=ui_view_state([back_button_rect,my_rank_rect]+tab_rects,scroll,tab_index,my_position,total)
+        if ui_needs_redraw(events,last_view,view) or not UI_IDLE_MODE:
+            screen.fill(BLACK)
+            title_surf=render_text(fonts.menu_font_title,"Leaderboard",YELLOW)
+            screen.blit(title_surf,title_surf.get_rect(center=(SCREEN_WIDTH//2,50)))
+            for i,(label,_) in enumerate(LEADERBOARD_TABS):
+                active=i==tab_index
+                draw_button(label,fonts.font_style_panel,YELLOW if active else WHITE,tab_rects[i],MENU_BUTTON_HOVER_COLOR if active else MENU_BUTTON_COLOR,MENU_BUTTON_HOVER_COLOR)
+            if not total:
+                no_scores_surf=render_text(fonts.menu_font_options,"Nessun punteggio!",WHITE)
+                screen.blit(no_scores_surf,no_scores_surf.get_rect(center=(SCREEN_WIDTH//2,SCREEN_HEIGHT//2-50)))
+            else:
+                for position,entry in pager.rows(scroll,visible):
+                    row_surf=render_leaderboard_row(position,entry,position==my_position)
+                    screen.blit(row_surf,(80,LEADERBOARD_LIST_TOP+(position-scroll)*LEADERBOARD_ROW_HEIGHT))
+                if total>visible: # Barra di scorrimento
+                    track=pygame.Rect(SCREEN_WIDTH-40,LEADERBOARD_LIST_TOP,8,visible*LEADERBOARD_ROW_HEIGHT)
+                    thumb_height=max(20,track.height*visible//total)
+                    thumb_y=track.y+(track.height-thumb_height)*scroll//max(1,total-visible)
+                    pygame.draw.rect(screen,MENU_BUTTON_COLOR,track,border_radius=4)
+                    pygame.draw.rect(screen,MENU_TEXT_COLOR,(track.x,thumb_y,track.width,thumb_height),border_radius=4)
+            if last_player_name: draw_button("La mia posizione",fonts.font_style_panel,WHITE,my_rank_rect,MENU_BUTTON_COLOR,MENU_BUTTON_HOVER_COLOR)
+            if draw_button("Indietro",fonts.menu_font_options,WHITE,back_button_rect,MENU_BUTTON_COLOR,MENU_BUTTON_HOVER_COLOR)and mouse_clicked_this_frame:
+                running=False;game_state="MENU"
+            pygame.display.flip(); last_view=view
+        clock.tick(UI_FPS)
 
 def settings_screen_loop(is_modal=False): # Invariata
     global game_state, current_volume 
-    running = True; volume_step = 0.1; button_font = menu_font_options
+    running = True; volume_step = 0.1; button_font = fonts.menu_font_options
     button_text_color = WHITE; button_main_color = MENU_BUTTON_COLOR; button_hover_color = MENU_BUTTON_HOVER_COLOR
     modal_bg_rect = None
     if is_modal:
@@ -239,34 +624,38 @@ def settings_screen_loop(is_modal=False): # Invariata
         vol_up_rect = pygame.Rect(SCREEN_WIDTH // 2 + 75, vol_buttons_y_pos, vol_button_size, vol_button_size)
         back_button_rect = pygame.Rect(SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT - 80, 200, 50)
         back_button_text = "Indietro"
+    last_view = None; redraw_pending = True
     while running:
         mouse_clicked_this_frame = False
-        for event in pygame.event.get():
+        events = wait_ui_events(redraw_pending)
+        for event in events:
             if event.type == pygame.QUIT: pygame.quit(); sys.exit()
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE: running = False; 
                 if not is_modal: game_state = "MENU"
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1: mouse_clicked_this_frame = True
+        view = ui_view_state((vol_down_rect, vol_up_rect, back_button_rect), current_volume)
+        if not (redraw_pending or ui_needs_redraw(events, last_view, view) or not UI_IDLE_MODE):
+            clock.tick(UI_FPS); continue
+        redraw_pending = False
         if is_modal and modal_bg_rect is not None:
             pygame.draw.rect(screen, PANEL_COLOR, modal_bg_rect, border_radius=15)
             pygame.draw.rect(screen, WHITE, modal_bg_rect, 3, border_radius=15)
         elif not is_modal: screen.fill(BLACK)
-        title_surf = menu_font_title.render("Impostazioni", True, YELLOW)
+        title_surf = render_text(fonts.menu_font_title, "Impostazioni", YELLOW)
         screen.blit(title_surf, title_surf.get_rect(center=(title_rect_center_x, title_rect_top_y)))
-        volume_text_surf = menu_font_options.render(f"Volume: {int(current_volume * 100)}%", True, MENU_TEXT_COLOR)
+        volume_text_surf = render_text(fonts.menu_font_options, f"Volume: {int(current_volume * 100)}%", MENU_TEXT_COLOR)
         screen.blit(volume_text_surf, volume_text_surf.get_rect(center=(volume_text_center_x, volume_text_center_y)))
         if draw_button("-", button_font, button_text_color, vol_down_rect, button_main_color, button_hover_color) and mouse_clicked_this_frame:
-            current_volume = round(max(0.0, current_volume - volume_step), 1)
-            if eat_sound: eat_sound.set_volume(current_volume)
-            if game_over_sound: game_over_sound.set_volume(current_volume)
+            current_volume = round(max(0.0, current_volume - volume_step), 1); redraw_pending = True
+            sound_manager.set_master_volume(current_volume)
         if draw_button("+", button_font, button_text_color, vol_up_rect, button_main_color, button_hover_color) and mouse_clicked_this_frame:
-            current_volume = round(min(1.0, current_volume + volume_step), 1)
-            if eat_sound: eat_sound.set_volume(current_volume)
-            if game_over_sound: game_over_sound.set_volume(current_volume)
+            current_volume = round(min(1.0, current_volume + volume_step), 1); redraw_pending = True
+            sound_manager.set_master_volume(current_volume)
         if draw_button(back_button_text, button_font, button_text_color, back_button_rect, button_main_color, button_hover_color) and mouse_clicked_this_frame:
             running = False
             if not is_modal: game_state = "MENU"
-        pygame.display.flip(); clock.tick(UI_FPS)
+        pygame.display.flip(); last_view = view; clock.tick(UI_FPS)
 
 def run_pause_menu(): # Invariata
     global game_state
@@ -279,219 +668,268 @@ def run_pause_menu(): # Invariata
     main_menu_rect = pygame.Rect(SCREEN_WIDTH//2-button_width//2, menu_block_start_y + 2*(button_height+spacing), button_width, button_height)
     exit_game_rect = pygame.Rect(SCREEN_WIDTH//2-button_width//2, menu_block_start_y + 3*(button_height+spacing), button_width, button_height)
     overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT - PANEL_HEIGHT), pygame.SRCALPHA); overlay.fill(PAUSE_OVERLAY_COLOR)
-    action_taken = "RESUME"
+    action_taken = "RESUME"; last_view = None; redraw_pending = True
     while paused:
-        screen.blit(game_paused_surface, (0,0)); screen.blit(overlay, (0, PANEL_HEIGHT))
-        pause_title_surf = menu_font_title.render("Pausa", True, YELLOW)
-        screen.blit(pause_title_surf, pause_title_surf.get_rect(center=(SCREEN_WIDTH // 2, PANEL_HEIGHT + GAME_AREA_HEIGHT // 2 - 120 )))
         mouse_clicked_this_frame = False
-        for event in pygame.event.get():
+        events = wait_ui_events(redraw_pending)
+        for event in events:
             if event.type == pygame.QUIT: action_taken = "EXIT_GAME"; paused = False
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE: action_taken = "RESUME"; paused = False
+            if controls.is_pause_event(event): action_taken = "RESUME"; paused = False # ESC o Start del gamepad
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1: mouse_clicked_this_frame = True
-        if draw_button("Riprendi", pause_menu_font, MENU_TEXT_COLOR, resume_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        if not paused: break
+        view = ui_view_state((resume_rect, settings_rect, main_menu_rect, exit_game_rect))
+        if not (redraw_pending or ui_needs_redraw(events, last_view, view) or not UI_IDLE_MODE):
+            clock.tick(UI_FPS); continue
+        redraw_pending = False
+        screen.blit(game_paused_surface, (0,0)); screen.blit(overlay, (0, PANEL_HEIGHT))
+        pause_title_surf = render_text(fonts.menu_font_title, "Pausa", YELLOW)
+        screen.blit(pause_title_surf, pause_title_surf.get_rect(center=(SCREEN_WIDTH // 2, PANEL_HEIGHT + GAME_AREA_HEIGHT // 2 - 120 )))
+        if draw_button("Riprendi", fonts.pause_menu_font, MENU_TEXT_COLOR, resume_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             action_taken = "RESUME"; paused = False
-        elif draw_button("Impostazioni", pause_menu_font, MENU_TEXT_COLOR, settings_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        elif draw_button("Impostazioni", fonts.pause_menu_font, MENU_TEXT_COLOR, settings_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             settings_screen_loop(is_modal=True)
             pygame.event.get(eventtype=[pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP]) 
-            mouse_clicked_this_frame = False 
-        elif draw_button("Menu Principale", pause_menu_font, MENU_TEXT_COLOR, main_menu_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+            mouse_clicked_this_frame = False; redraw_pending = True
+        elif draw_button("Menu Principale", fonts.pause_menu_font, MENU_TEXT_COLOR, main_menu_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             action_taken = "GOTO_MAIN_MENU"; paused = False
-        elif draw_button("Esci dal Gioco", pause_menu_font, MENU_TEXT_COLOR, exit_game_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        elif draw_button("Esci dal Gioco", fonts.pause_menu_font, MENU_TEXT_COLOR, exit_game_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             action_taken = "EXIT_GAME"; paused = False
-        pygame.display.flip(); clock.tick(UI_FPS)
+        pygame.display.flip(); last_view = view; clock.tick(UI_FPS)
     return action_taken
 
-# --- MODIFICHE PRINCIPALI: game_loop per gestire le modalità ---
+# --- game_loop: input e disegno, le regole sono in SnakeEngine (snake_engine.py) ---
 def game_loop():
-    global top_score_value, game_state, leaderboard_data, current_score_for_name_entry, current_game_mode
+    global top_score_value, game_state, leaderboard_data, current_score_for_name_entry, current_game_mode, last_game_rank, last_game_replay
 
     current_game_fps = INITIAL_FPS
     game_over_flag = False; game_close_screen = False
-    
-    snake_start_x = GRID_WIDTH // 2
-    snake_start_y = GRID_HEIGHT // 2
-    snake_head_pos = [snake_start_x, snake_start_y] # snake_head_pos è una lista
-    snake_list = [list(snake_head_pos)] 
-    snake_length = 1
-    current_direction = RIGHT; change_to_direction = current_direction
-    
-    obstacles = []
-    if current_game_mode == "OBSTACLES":
-        obstacles = generate_random_obstacles(NUM_RANDOM_OBSTACLES, [list(snake_head_pos)])
-
-    food_pos = get_random_food_position(snake_list, obstacles)
-    score = 0
-    first_game_over_sound_played = False
+
+    ghost = open_ghost_replay(current_game_mode) if GHOST_RACING else None # Corre in parallelo, tick per tick
+    ghost_seed = ghost.reader.header.seed if ghost else None
+    engine = SnakeEngine(GRID_WIDTH, GRID_HEIGHT, NUM_RANDOM_OBSTACLES)
+    engine.reset(seed=ghost_seed, mode=current_game_mode) # Nuovo seme a ogni partita, o quello del fantasma
+    recorder = start_replay_recording(engine)
+    history = rewind.RewindHistory(REWIND_CAPACITY); practice_game = False # Riavvolta: niente replay né classifica
+    renderer = GameAreaRenderer()
+    if ghost: renderer.set_ghost(ghost.engine)
+    game_input = get_game_input(); game_input.clear()
+    current_direction = engine.direction
+    first_game_over_sound_played = False; game_over_drawn = False
+    tick_time = 0.0; turbo = False # Tempo accumulato verso il prossimo tick (secondi di gioco)
+    resync_clock = True # Dopo menu, pausa o game over il clock contiene ancora i loro tempi
 
     while not game_over_flag:
         while game_close_screen:
-            # ... (logica game over invariata) ...
             if not first_game_over_sound_played:
-                if game_over_sound: game_over_sound.play()
+                sound_manager.play("game_over")
                 first_game_over_sound_played = True
-                if check_if_qualifies(score, leaderboard_data):
-                    current_score_for_name_entry = score; game_state = "ENTER_NAME"
+                replay_file = finish_replay_recording(recorder, engine); recorder = None
+                last_game_replay = (replay_file, engine.snake_length) if replay_file else None
+                last_game_rank = None if practice_game else record_game_result(engine.score, current_game_mode)
+                if not practice_game and check_if_qualifies(engine.score, leaderboard_data):
+                    current_score_for_name_entry = engine.score; game_state = "ENTER_NAME"
                     game_close_screen = False; game_over_flag = True; break
-            screen.fill(BLACK)
-            current_top_s = leaderboard_data[0]["score"] if leaderboard_data else 0
-            display_score_and_highscore_panel(score, current_top_s)
-            display_message_game_area("Hai perso!",RED,-70,chosen_font=game_over_font_big)
-            display_message_game_area(f"Punteggio: {score}",BLUE,-20,chosen_font=game_over_font_small)
-            display_message_game_area("Premi 'R' per Riprovare",WHITE,60,chosen_font=game_over_font_small)
-            display_message_game_area("'M' per Menu Principale",WHITE,100,chosen_font=game_over_font_small)
-            pygame.display.update()
-            for event in pygame.event.get():
+            if not game_over_drawn or not UI_IDLE_MODE: # Schermata statica: la si disegna una volta
+                screen.fill(BLACK)
+                current_top_s = leaderboard_data[0]["score"] if leaderboard_data else 0
+                display_score_and_highscore_panel(engine.score, current_top_s)
+                if engine.won: display_message_game_area("Hai vinto!",GREEN,-70,chosen_font=fonts.game_over_font_big)
+                else: display_message_game_area("Hai perso!",RED,-70,chosen_font=fonts.game_over_font_big)
+                display_message_game_area(f"Punteggio: {engine.score}",BLUE,-20,chosen_font=fonts.game_over_font_small)
+                if practice_game: display_message_game_area("Partita riavvolta: non entra in classifica",WHITE,20,chosen_font=fonts.font_style_panel)
+                elif last_game_rank: display_message_game_area(format_rank_line(last_game_rank),WHITE,20,chosen_font=fonts.font_style_panel)
+                display_message_game_area("Premi 'R' per Riprovare",WHITE,60,chosen_font=fonts.game_over_font_small)
+                display_message_game_area("'M' per Menu Principale",WHITE,100,chosen_font=fonts.game_over_font_small)
+                pygame.display.update(); game_over_drawn = True; game_input.frame_shown() # Il tick mortale si vede qui
+            events = wait_ui_events(False)
+            if ui_needs_redraw(events, None, None): game_over_drawn = False
+            clock.tick(UI_FPS)
+            for event in events:
                 if event.type == pygame.QUIT: pygame.quit(); sys.exit()
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_m: game_close_screen=False;game_over_flag=True;game_state="MENU"
-                    if event.key == pygame.K_r: 
+                    if event.key == pygame.K_r:
                         game_close_screen=False;game_over_flag=False
-                        snake_head_pos=[snake_start_x,snake_start_y];snake_list=[list(snake_head_pos)];snake_length=1
-                        current_direction=RIGHT;change_to_direction=current_direction
-                        if current_game_mode == "OBSTACLES": 
-                            obstacles = generate_random_obstacles(NUM_RANDOM_OBSTACLES, [list(snake_head_pos)])
-                        else: obstacles = []
-                        food_pos=get_random_food_position(snake_list, obstacles);score=0
-                        first_game_over_sound_played=False;current_game_fps=INITIAL_FPS
+                        engine.reset(seed=ghost_seed, mode=current_game_mode); renderer.invalidate_background()
+                        if ghost: ghost.seek(0); renderer.set_ghost(ghost.engine)
+                        recorder = start_replay_recording(engine); history.clear(); practice_game = False
+                        current_direction=engine.direction;game_input.clear()
+                        first_game_over_sound_played=False;game_over_drawn=False;current_game_fps=INITIAL_FPS;tick_time=0.0;resync_clock=True
                         break
             if not game_close_screen: break
         if game_over_flag: break
 
+        now = time.perf_counter() # Eventi letti a ogni frame: i comandi vanno in coda con il loro istante
         for event in pygame.event.get():
-            # ... (gestione eventi invariata, inclusa la pausa con ESC) ...
-            if event.type == pygame.QUIT: pygame.quit(); sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    pause_action = run_pause_menu()
-                    if pause_action == "GOTO_MAIN_MENU": game_over_flag = True; game_state = "MENU"
-                    elif pause_action == "EXIT_GAME": pygame.quit(); sys.exit()
-                    break 
-                elif event.key==pygame.K_a and current_direction!=RIGHT: change_to_direction=LEFT
-                elif event.key==pygame.K_d and current_direction!=LEFT: change_to_direction=RIGHT
-                elif event.key==pygame.K_w and current_direction!=DOWN: change_to_direction=UP
-                elif event.key==pygame.K_s and current_direction!=UP: change_to_direction=DOWN
+            if event.type == pygame.QUIT:
+                if recorder: recorder.abort()
+                pygame.quit(); sys.exit()
+            if controls.is_pause_event(event):
+                pause_action = run_pause_menu(); renderer.invalidate(); tick_time = 0.0; resync_clock = True; game_input.clear()
+                if pause_action in ("GOTO_MAIN_MENU","EXIT_GAME") and recorder: recorder.abort() # Partita abbandonata
+                if pause_action == "GOTO_MAIN_MENU": game_over_flag = True; game_state = "MENU"
+                elif pause_action == "EXIT_GAME": pygame.quit(); sys.exit()
+                break
+            elif event.type == pygame.KEYDOWN and event.key == TURBO_KEY: turbo = not turbo
+            else: game_input.handle_event(event, engine.direction, now)
         if game_over_flag: break
 
-
-        current_direction=change_to_direction
-        snake_head_pos[0]+=current_direction[0]; snake_head_pos[1]+=current_direction[1]
-
-        if current_game_mode == "BORDERLESS":
-            if snake_head_pos[0] >= GRID_WIDTH: snake_head_pos[0] = 0
-            elif snake_head_pos[0] < 0: snake_head_pos[0] = GRID_WIDTH - 1
-            if snake_head_pos[1] >= GRID_HEIGHT: snake_head_pos[1] = 0
-            elif snake_head_pos[1] < 0: snake_head_pos[1] = GRID_HEIGHT - 1
-        else: 
-            if not (0 <= snake_head_pos[0] < GRID_WIDTH and 0 <= snake_head_pos[1] < GRID_HEIGHT):
-                game_close_screen = True
-
-        if list(snake_head_pos) in snake_list[:-1]: 
-            game_close_screen = True 
-        
-        if current_game_mode == "OBSTACLES":
-            # --- MODIFICA QUI ---
-            if tuple(snake_head_pos) in obstacles: # Converti snake_head_pos in tupla per il confronto
-            # --- FINE MODIFICA ---
-                game_close_screen = True
-        
+        # Passo fisso: il tempo del frame si accumula e si consuma un tick alla volta
+        if resync_clock: clock.tick(); resync_clock = False # Si riparte da qui: nessun tick di recupero
+        else: tick_time += min(clock.get_time() / 1000.0, MAX_FRAME_TIME) * (TURBO_MULTIPLIER if turbo else 1)
+        rewinding = pygame.key.get_pressed()[REWIND_KEY]; ticks_this_frame = 0
+        while tick_time >= 1.0 / current_game_fps:
+            if ticks_this_frame >= MAX_TICKS_PER_FRAME: tick_time = 0.0; break # Troppo indietro: si riparte da qui
+            tick_time -= 1.0 / current_game_fps; ticks_this_frame += 1
+            if rewinding: # Riavvolgimento: la partita torna indietro finché c'è storia
+                rewound = False
+                for _ in range(REWIND_TICKS_PER_TICK): rewound = history.step_back(engine) or rewound
+                if rewound:
+                    if recorder: recorder.abort(); recorder = None
+                    practice_game = True; renderer.invalidate()
+                    current_direction = engine.direction; game_input.clear()
+                    current_game_fps = min(INITIAL_FPS + engine.foods_eaten * FPS_INCREMENT_PER_FOOD, MAX_FPS)
+                    if ghost: ghost.seek(engine.tick); renderer.set_ghost(None if ghost.engine.game_over else ghost.engine)
+                continue
+
+            food_before = engine.food_idx
+            events = engine.step(game_input.next_direction(engine.direction)) # Un comando in coda per tick
+            if recorder:
+                if engine.direction != current_direction: recorder.record(engine.tick, engine.direction)
+                recorder.after_step(engine) # Keyframe per i salti nel replay
+            if not engine.game_over: history.record(engine, current_direction, food_before, EVENT_EAT in events)
+            if ghost and not ghost.engine.game_over:
+                ghost.step()
+                if ghost.engine.game_over: renderer.set_ghost(None) # Partita del fantasma finita: sparisce
+                else: renderer.apply_ghost_step(ghost.engine)
+            current_direction = engine.direction
+            if EVENT_DEATH in events:
+                game_close_screen = True; break
+
+            if EVENT_EAT in events:
+                sound_manager.play("eat")
+                if EVENT_WIN in events: game_close_screen = True; break # Board piena: niente più cibo
+                if current_game_fps < MAX_FPS:
+                    current_game_fps += FPS_INCREMENT_PER_FOOD
+                    current_game_fps = min(current_game_fps, MAX_FPS)
+            renderer.apply_step(engine)
         if game_close_screen: continue
 
-        snake_list.append(list(snake_head_pos))
-        if len(snake_list)>snake_length: del snake_list[0]
-
-        if snake_head_pos[0]==food_pos[0] and snake_head_pos[1]==food_pos[1]:
-            food_pos=get_random_food_position(snake_list, obstacles); snake_length+=1; score+=10
-            if eat_sound: eat_sound.play()
-            if current_game_fps < MAX_FPS:
-                current_game_fps += FPS_INCREMENT_PER_FOOD
-                current_game_fps = min(current_game_fps, MAX_FPS)
-        
-        screen.fill(BLACK)
         current_top_s = leaderboard_data[0]["score"] if leaderboard_data else 0
-        display_score_and_highscore_panel(score, current_top_s)
-        
-        if current_game_mode == "OBSTACLES": 
-            draw_obstacles(obstacles)
-
-        draw_snake(snake_list); draw_food(food_pos)
-        pygame.display.update(); clock.tick(current_game_fps)
+        if INTERPOLATE_MOTION and not rewinding: renderer.present(engine, current_top_s, tick_time * current_game_fps, game_input.peek_direction(engine.direction))
+        else: renderer.present(engine, current_top_s)
+        game_input.frame_shown() # present() ha appena chiamato pygame.display.update()
+        clock.tick(RENDER_FPS)
+    if ghost: ghost.reader.close()
 
 
 # --- NUOVA Schermata: Selezione Modalità ---
 def select_mode_loop():
-    global game_state, current_game_mode
+    global game_state, current_game_mode, GHOST_RACING
     running = True
 
     button_width = 350; button_height = 50; spacing = 20
     # Calcolo per centrare il blocco di pulsanti
-    num_buttons_mode = 4 # Classica, Ostacoli, Libera, Indietro
+    num_buttons_mode = 5 # Classica, Ostacoli, Libera, Fantasma, Indietro
     total_buttons_height_mode = num_buttons_mode * button_height + (num_buttons_mode - 1) * spacing
     start_y_mode = (SCREEN_HEIGHT - total_buttons_height_mode) / 2 # Centrato verticalmente
 
     classic_rect = pygame.Rect(SCREEN_WIDTH//2 - button_width//2, start_y_mode, button_width, button_height)
     obstacles_rect = pygame.Rect(SCREEN_WIDTH//2 - button_width//2, start_y_mode + (button_height + spacing), button_width, button_height)
     borderless_rect = pygame.Rect(SCREEN_WIDTH//2 - button_width//2, start_y_mode + 2 * (button_height + spacing), button_width, button_height)
-    back_rect = pygame.Rect(SCREEN_WIDTH//2 - button_width//2, start_y_mode + 3 * (button_height + spacing) + 20, button_width, button_height) # +20 per più spazio
+    ghost_rect = pygame.Rect(SCREEN_WIDTH//2 - button_width//2, start_y_mode + 3 * (button_height + spacing), button_width, button_height)
+    back_rect = pygame.Rect(SCREEN_WIDTH//2 - button_width//2, start_y_mode + 4 * (button_height + spacing) + 20, button_width, button_height) # +20 per più spazio
 
+    last_view = None
     while running:
         mouse_clicked_this_frame = False
-        for event in pygame.event.get():
+        events = wait_ui_events(last_view is None)
+        for event in events:
             if event.type == pygame.QUIT: pygame.quit(); sys.exit()
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE: game_state = "MENU"; running = False # ESC torna al menu principale
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1: mouse_clicked_this_frame = True
-        
+        if not running: break
+        view = ui_view_state((classic_rect, obstacles_rect, borderless_rect, ghost_rect, back_rect), GHOST_RACING)
+        if not (ui_needs_redraw(events, last_view, view) or not UI_IDLE_MODE):
+            clock.tick(UI_FPS); continue
+
         screen.fill(BLACK)
-        title_surf = submenu_font_title.render("Seleziona Modalità", True, YELLOW) # Usa il nuovo font
+        title_surf = render_text(fonts.submenu_font_title, "Seleziona Modalità", YELLOW) # Usa il nuovo font
         screen.blit(title_surf, title_surf.get_rect(center=(SCREEN_WIDTH // 2, start_y_mode - 70)))
 
-        if draw_button("Classica", menu_font_options, MENU_TEXT_COLOR, classic_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        if draw_button("Classica", fonts.menu_font_options, MENU_TEXT_COLOR, classic_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             current_game_mode = "CLASSIC"; game_state = "GAME"; running = False
-        if draw_button("Ostacoli Casuali", menu_font_options, MENU_TEXT_COLOR, obstacles_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        if draw_button("Ostacoli Casuali", fonts.menu_font_options, MENU_TEXT_COLOR, obstacles_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             current_game_mode = "OBSTACLES"; game_state = "GAME"; running = False
-        if draw_button("Senza Muri (Libera)", menu_font_options, MENU_TEXT_COLOR, borderless_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        if draw_button("Senza Muri (Libera)", fonts.menu_font_options, MENU_TEXT_COLOR, borderless_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             current_game_mode = "BORDERLESS"; game_state = "GAME"; running = False
-        if draw_button("Menu Principale", menu_font_options, MENU_TEXT_COLOR, back_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        if draw_button(f"Sfida il fantasma: {'Sì' if GHOST_RACING else 'No'}", fonts.menu_font_options, MENU_TEXT_COLOR, ghost_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+            GHOST_RACING = not GHOST_RACING; last_view = None; continue # Ridisegna con la nuova scritta
+        if draw_button("Menu Principale", fonts.menu_font_options, MENU_TEXT_COLOR, back_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             game_state = "MENU"; running = False
         
-        pygame.display.flip()
+        pygame.display.flip(); last_view = view
         clock.tick(UI_FPS)
 
 
 # --- MODIFICA: Menu Principale per chiamare la selezione modalità ---
 def main_menu_loop():
-    global game_state # game_state è già globale
+    global game_state, startup_report_pending, leaderboard_data # game_state è già globale
     button_width=300; button_height=60; spacing=20; start_y=200
     new_game_rect=pygame.Rect(SCREEN_WIDTH//2-button_width//2,start_y,button_width,button_height)
     leaderboard_rect=pygame.Rect(SCREEN_WIDTH//2-button_width//2,start_y+(button_height+spacing),button_width,button_height)
     settings_rect=pygame.Rect(SCREEN_WIDTH//2-button_width//2,start_y+2*(button_height+spacing),button_width,button_height)
     exit_rect=pygame.Rect(SCREEN_WIDTH//2-button_width//2,start_y+3*(button_height+spacing),button_width,button_height)
-    menu_running=True
+    menu_running=True; last_view=None
     while menu_running:
         mouse_clicked_this_frame=False
-        for event in pygame.event.get():
+        events=wait_ui_events(last_view is None)
+        for event in events:
             if event.type == pygame.QUIT: pygame.quit(); sys.exit()
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1: mouse_clicked_this_frame = True
+        view=ui_view_state((new_game_rect,leaderboard_rect,settings_rect,exit_rect))
+        if not (ui_needs_redraw(events,last_view,view) or not UI_IDLE_MODE):
+            clock.tick(UI_FPS); continue
         screen.fill(BLACK)
-        title_surf = menu_font_title.render("Snake Game", True, GREEN)
+        title_surf = render_text(fonts.menu_font_title, "Snake Game", GREEN)
         screen.blit(title_surf, title_surf.get_rect(center=(SCREEN_WIDTH // 2, 100)))
         
-        if draw_button("Nuova Partita", menu_font_options, MENU_TEXT_COLOR, new_game_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        if draw_button("Nuova Partita", fonts.menu_font_options, MENU_TEXT_COLOR, new_game_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             game_state = "SELECT_MODE"; menu_running = False # Va alla selezione modalità
         
-        if draw_button("Leaderboard", menu_font_options, MENU_TEXT_COLOR, leaderboard_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        if draw_button("Leaderboard", fonts.menu_font_options, MENU_TEXT_COLOR, leaderboard_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             leaderboard_data = load_leaderboard(); game_state = "LEADERBOARD"; menu_running = False
-        if draw_button("Impostazioni", menu_font_options, MENU_TEXT_COLOR, settings_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        if draw_button("Impostazioni", fonts.menu_font_options, MENU_TEXT_COLOR, settings_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             game_state = "SETTINGS"; menu_running = False
-        if draw_button("Esci", menu_font_options, MENU_TEXT_COLOR, exit_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
+        if draw_button("Esci", fonts.menu_font_options, MENU_TEXT_COLOR, exit_rect, MENU_BUTTON_COLOR, MENU_BUTTON_HOVER_COLOR) and mouse_clicked_this_frame:
             pygame.quit(); sys.exit()
-        pygame.display.flip(); clock.tick(UI_FPS)
+        pygame.display.flip(); last_view=view
+        if startup_report_pending: report_startup_times(); startup_report_pending=False
+        clock.tick(UI_FPS)
 
 # Avvio del gioco (Loop Principale dell'Applicazione MODIFICATO per nuovo stato)
+def parse_args():
+    parser=argparse.ArgumentParser(description="PySnake")
+    parser.add_argument("--startup-report",action="store_true",help="stampa i tempi di avvio fino al primo frame del menu")
+    parser.add_argument("--leaderboard-backend",choices=leaderboard_store.BACKENDS,default=LEADERBOARD_BACKEND,help="formato di salvataggio della leaderboard")
+    parser.add_argument("--audio-buffer",type=int,default=AUDIO_BUFFER_SIZE,help="dimensione del buffer del mixer in campioni")
+    parser.add_argument("--record-replays",action="store_true",help=f"salva il replay di ogni partita in {REPLAY_DIR}/")
+    parser.add_argument("--ghost",action="store_true",help="sfida il fantasma del miglior replay della modalità")
+    parser.add_argument("--render-fps",type=int,default=RENDER_FPS,help="frame disegnati al secondo (0: frequenza dello schermo)")
+    parser.add_argument("--input-latency",action="store_true",help=f"misura il ritardo dei comandi fino al tick e allo schermo; all'uscita stampa i percentili e salva gli istogrammi in {INPUT_LATENCY_FILE}")
+    parser.add_argument("--input-latency-file",help="file JSON per gli istogrammi dei ritardi (implica --input-latency)")
+    parser.add_argument("--no-interpolation",action="store_true",help="disegna solo i tick, senza il movimento tra l'uno e l'altro")
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    load_sounds()
-    leaderboard_data = load_leaderboard()
+    args = parse_args(); startup_report_pending = args.startup_report; AUDIO_BUFFER_SIZE = args.audio_buffer
+    LEADERBOARD_BACKEND = args.leaderboard_backend; RECORD_REPLAYS = args.record_replays; GHOST_RACING = args.ghost
+    RENDER_FPS = max(args.render_fps, 0); INTERPOLATE_MOTION = not args.no_interpolation; INPUT_LATENCY_REPORT = args.input_latency or bool(args.input_latency_file)
+    if args.input_latency_file: INPUT_LATENCY_FILE = args.input_latency_file
+    bootstrap()
+    t = time.perf_counter(); load_sounds(); mark_startup_phase("audio (avvio thread)", t)
+    t = time.perf_counter(); leaderboard_data = load_leaderboard(); mark_startup_phase("leaderboard", t)
     if leaderboard_data: top_score_value = leaderboard_data[0]["score"]
     else: top_score_value = 0
 
@@ -501,4 +939,4 @@ if __name__ == '__main__':
         elif game_state == "GAME": game_loop()
         elif game_state == "LEADERBOARD": leaderboard_screen_loop()
         elif game_state == "SETTINGS": settings_screen_loop(is_modal=False)
-        elif game_state == "ENTER_NAME": name_input_loop(current_score_for_name_entry)
\ No newline at end of file
+        elif game_state == "ENTER_NAME": name_input_loop(current_score_for_name_entry,last_game_rank)
\ No newline at end of file
@@ -0,0 +1,348 @@
+# --- Replay binari di PySnake ---
+# Una partita è determinata da modalità, griglia, seme e dai cambi di direzione con il loro
+# tick: il replay salva solo questo e per rivederla la si ri-simula con SnakeEngine.
+#
+# Formato (versione 2, interi little-endian):
+#   intestazione  "PSRP", versione (u8), modalità (u8, indice in GAME_MODES),
+#                 larghezza, altezza, ostacoli (u16), seme (u64), intervallo keyframe (u16)
+#   frame         lunghezza (u32), tipo (u8) + blocco compresso con zlib, decomprimibile da solo
+#     record      tick di partenza (varint) e poi record varint (delta_tick << 3 | codice),
+#                 con il delta rispetto al record precedente:
+#                   codici 0-3  direzione (UP, DOWN, LEFT, RIGHT) applicata in quel tick
+#                   codice 4    fine partita, seguito da punteggio e lunghezza (varint)
+#     keyframe    stato della partita dopo un tick multiplo dell'intervallo (pack_keyframe)
+#     indice      numero di keyframe e coppie (delta tick, delta offset), alla fine del file
+#   coda          offset dell'indice (u64), tick finale, punteggio, lunghezza (u32), "PSRX"
+# A ogni keyframe le celle libere del motore tornano in ordine crescente, sia registrando sia
+# ri-simulando: così un keyframe contiene solo corpo e contatori. Per saltare a un tick si
+# riparte dal keyframe precedente e si simula al massimo un intervallo di tick.
+# Una partita di 30 minuti sono poche migliaia di cambi di direzione: qualche decina di KB.
+# I file della versione 1 (senza tipo dei frame, keyframe e indice) restano leggibili.
+# Nessuna dipendenza da pygame.
+import bisect
+import mmap
+import os
+import struct
+import zlib
+from array import array
+
+from snake_engine import SnakeEngine, GAME_MODES, DIRECTIONS, DIRECTION_INDEX, NO_EVENTS
+
+REPLAY_MAGIC=b"PSRP"; REPLAY_VERSION=2; SUPPORTED_VERSIONS=(1, 2)
+REPLAY_EXTENSION=".psr"
+HEADER_FORMATS={1:struct.Struct("<4sBBHHHQ"), 2:struct.Struct("<4sBBHHHQH")}
+FRAME_HEADERS={1:struct.Struct("<I"), 2:struct.Struct("<IB")}
+FOOTER=struct.Struct("<QIII4s"); FOOTER_MAGIC=b"PSRX"
+FRAME_RECORDS=256 # Record per frame: un frame viene compresso e scritto quando è pieno
+KEYFRAME_INTERVAL=512 # Tick tra due keyframe: un salto simula al massimo questi tick
+
+FRAME_RECORD=0; FRAME_KEYFRAME=1; FRAME_INDEX=2
+DIRECTION_CODES=DIRECTION_INDEX; CODE_DIRECTIONS=DIRECTIONS
+CODE_END=4
+KEYFRAME_FIELDS=9 # Interi di snapshot() prima del corpo
+
+
+class ReplayError(ValueError):
+    pass
+
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80); value>>=7
+    out.append(value)
+
+
+def decode_varint(data, pos):
+    result=0; shift=0
+    while True:
+        if pos >= len(data): raise ReplayError("varint troncato")
+        byte=data[pos]; pos+=1
+        result|=(byte & 0x7F) << shift
+        if byte < 0x80: return result, pos
+        shift+=7
+
+
+def pack_keyframe(state):
+    # snapshot() del motore: interi come varint (food_idx +1, perché vale -1 a board piena),
+    # corpo come differenze tra celle consecutive in zigzag, quasi sempre un byte a segmento
+    out=bytearray(); fields=list(state[:KEYFRAME_FIELDS]); fields[5]+=1
+    for value in fields: encode_varint(value, out)
+    body=state[KEYFRAME_FIELDS]; encode_varint(len(body), out); previous=0
+    for idx in body:
+        delta=idx-previous; previous=idx
+        encode_varint(delta << 1 if delta >= 0 else (-delta << 1)-1, out)
+    return bytes(out)
+
+
+def unpack_keyframe(data):
+    fields=[]; pos=0
+    for _ in range(KEYFRAME_FIELDS):
+        value, pos = decode_varint(data, pos); fields.append(value)
+    fields[5]-=1
+    count, pos = decode_varint(data, pos); body=[]; previous=0
+    for _ in range(count):
+        value, pos = decode_varint(data, pos)
+        previous+=-((value+1) >> 1) if value & 1 else value >> 1
+        body.append(previous)
+    if not body or fields[1] >= len(DIRECTIONS): raise ReplayError("keyframe non valido")
+    fields.append(array('i', body)) # Come in snapshot()
+    return tuple(fields)
+
+
+class ReplayHeader:
+    def __init__(self, mode, grid_width, grid_height, num_obstacles, seed, keyframe_interval=KEYFRAME_INTERVAL, version=REPLAY_VERSION):
+        self.mode=mode; self.grid_width=grid_width; self.grid_height=grid_height
+        self.num_obstacles=num_obstacles; self.seed=seed; self.version=version
+        self.keyframe_interval=keyframe_interval if version >= 2 else 0
+
+    @classmethod
+    def from_engine(cls, engine, keyframe_interval=KEYFRAME_INTERVAL):
+        return cls(engine.mode, engine.grid_width, engine.grid_height, engine.num_obstacles, engine.seed, keyframe_interval)
+
+    @property
+    def size(self):
+        return HEADER_FORMATS[self.version].size
+
+    def pack(self):
+        # Si scrive sempre la versione corrente
+        return HEADER_FORMATS[REPLAY_VERSION].pack(REPLAY_MAGIC, REPLAY_VERSION, GAME_MODES.index(self.mode), self.grid_width,
+                                                   self.grid_height, self.num_obstacles, self.seed, self.keyframe_interval)
+
+    @classmethod
+    def unpack(cls, data):
+        if len(data) < 5: raise ReplayError("intestazione troncata")
+        if data[:4] != REPLAY_MAGIC: raise ReplayError("non è un replay di PySnake")
+        version=data[4]
+        if version not in SUPPORTED_VERSIONS: raise ReplayError(f"versione del replay non supportata: {version}")
+        header_format=HEADER_FORMATS[version]
+        if len(data) < header_format.size: raise ReplayError("intestazione troncata")
+        fields=header_format.unpack_from(data)
+        mode_index, width, height, obstacles, seed = fields[2:7]
+        if mode_index >= len(GAME_MODES): raise ReplayError("modalità sconosciuta")
+        return cls(GAME_MODES[mode_index], width, height, obstacles, seed, fields[7] if version >= 2 else 0, version)
+
+    def new_engine(self):
+        engine=SnakeEngine(self.grid_width, self.grid_height, self.num_obstacles)
+        engine.reset(seed=self.seed, mode=self.mode)
+        return engine
+
+
+def after_replay_step(engine, keyframe_interval):
+    # Da chiamare dopo ogni tick registrato o ri-simulato: True se il tick è un keyframe
+    # (e allora le celle libere sono appena tornate in ordine crescente)
+    if keyframe_interval and engine.tick % keyframe_interval == 0 and not engine.game_over:
+        engine.canonicalize_free_cells(); return True
+    return False
+
+
+class ReplayWriter:
+    # Registra una partita in streaming: record() costa un paio di append su un bytearray
+    # e solo ogni FRAME_RECORDS record si comprime un frame e lo si passa al file (bufferizzato).
+    # after_step() va chiamata dopo ogni tick e ai multipli dell'intervallo scrive un keyframe.
+    # Si scrive su path+".part", rinominato in path da finish(): un replay incompleto
+    # (partita abbandonata) non prende mai il nome definitivo e abort() lo cancella.
+    def __init__(self, path, header):
+        self.path=path; self.part_path=path+".part"; self.file=open(self.part_path,'wb')
+        self.keyframe_interval=header.keyframe_interval
+        data=header.pack(); self.file.write(data); self.offset=len(data)
+        self.frame=bytearray(); self.frame_records=0
+        self.last_tick=0; self.closed=False
+        self.keyframes=[] # (tick, offset) per l'indice in fondo al file
+
+    def _write_frame(self, kind, payload):
+        data=zlib.compress(payload, 9); offset=self.offset
+        self.file.write(FRAME_HEADERS[REPLAY_VERSION].pack(len(data), kind)); self.file.write(data)
+        self.offset+=FRAME_HEADERS[REPLAY_VERSION].size+len(data)
+        return offset
+
+    def _append(self, tick, code):
+        if self.frame_records == 0: encode_varint(self.last_tick, self.frame)
+        encode_varint((tick-self.last_tick) << 3 | code, self.frame)
+        self.last_tick=tick; self.frame_records+=1
+
+    def record(self, tick, direction):
+        self._append(tick, DIRECTION_CODES[direction])
+        if self.frame_records >= FRAME_RECORDS: self.flush_frame()
+
+    def after_step(self, engine):
+        if after_replay_step(engine, self.keyframe_interval):
+            # I record fino a questo tick vanno prima del keyframe: chi riparte da qui legge solo i successivi
+            self.flush_frame()
+            self.keyframes.append((engine.tick, self._write_frame(FRAME_KEYFRAME, pack_keyframe(engine.snapshot()))))
+
+    def flush_frame(self):
+        if not self.frame_records: return
+        self._write_frame(FRAME_RECORD, bytes(self.frame))
+        self.frame.clear(); self.frame_records=0
+
+    def finish(self, tick, score, length):
+        self._append(tick, CODE_END)
+        encode_varint(score, self.frame); encode_varint(length, self.frame)
+        self.flush_frame()
+        index=bytearray(); encode_varint(len(self.keyframes), index); previous_tick=previous_offset=0
+        for keyframe_tick, offset in self.keyframes:
+            encode_varint(keyframe_tick-previous_tick, index); encode_varint(offset-previous_offset, index)
+            previous_tick, previous_offset = keyframe_tick, offset
+        index_offset=self._write_frame(FRAME_INDEX, bytes(index))
+        self.file.write(FOOTER.pack(index_offset, tick, score, length, FOOTER_MAGIC))
+        self.file.close(); self.closed=True
+        os.replace(self.part_path, self.path)
+
+    def abort(self):
+        if self.closed: return
+        self.file.close(); self.closed=True
+        try: os.unlink(self.part_path)
+        except OSError: pass
+
+
+class ReplayReader:
+    # Legge un replay mappato in memoria (mmap): si decomprime solo il frame che serve e il
+    # sistema carica solo le pagine lette, anche per saltare in mezzo a una partita lunga
+    def __init__(self, path):
+        self.path=path
+        with open(path,'rb') as f:
+            try: self.data=mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: raise ReplayError("file vuoto")
+        try: self.header=ReplayHeader.unpack(self.data[:HEADER_FORMATS[REPLAY_VERSION].size])
+        except ReplayError: self.data.close(); raise
+        self.frame_header=FRAME_HEADERS[self.header.version]
+        self.frames_start=self.header.size; self.frames_end=len(self.data)
+        self.final_score=None; self.final_length=None; self.end_tick=None
+        self.keyframe_ticks=None; self.keyframe_offsets=None
+        try: self._read_footer()
+        except ReplayError: self.data.close(); raise
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    def close(self):
+        self.data.close()
+
+    def _read_footer(self):
+        # Indice dei keyframe dalla coda del file; se manca (versione 1) lo si ricostruisce
+        # al primo salto scorrendo le intestazioni dei frame
+        if self.header.version < 2 or len(self.data) < self.frames_start+FOOTER.size: return
+        index_offset, end_tick, score, length, magic = FOOTER.unpack_from(self.data, len(self.data)-FOOTER.size)
+        if magic != FOOTER_MAGIC or not self.frames_start <= index_offset < len(self.data)-FOOTER.size: return
+        self.frames_end=len(self.data)-FOOTER.size
+        self.end_tick=end_tick; self.final_score=score; self.final_length=length
+        _, kind, payload = next(self.frames(index_offset))
+        if kind != FRAME_INDEX: raise ReplayError("indice dei keyframe non valido")
+        count, pos = decode_varint(payload, 0); ticks=[]; offsets=[]; tick=offset=0
+        for _ in range(count):
+            delta_tick, pos = decode_varint(payload, pos); delta_offset, pos = decode_varint(payload, pos)
+            tick+=delta_tick; offset+=delta_offset; ticks.append(tick); offsets.append(offset)
+        self.keyframe_ticks=ticks; self.keyframe_offsets=offsets
+
+    def _scan_keyframes(self):
+        ticks=[]; offsets=[]
+        for offset, kind, payload in self.frames(decompress=False):
+            if kind == FRAME_KEYFRAME:
+                try: ticks.append(decode_varint(zlib.decompress(payload), 0)[0])
+                except zlib.error as e: raise ReplayError(f"frame corrotto: {e}")
+                offsets.append(offset)
+        self.keyframe_ticks=ticks; self.keyframe_offsets=offsets
+
+    def frames(self, offset=None, decompress=True):
+        # (offset, tipo, contenuto) per ogni frame a partire da offset (default: il primo)
+        data=self.data; frame_header=self.frame_header; typed=self.header.version >= 2; end=self.frames_end
+        offset=self.frames_start if offset is None else offset
+        while offset < end:
+            if offset+frame_header.size > end: raise ReplayError("frame troncato")
+            fields=frame_header.unpack_from(data, offset)
+            start=offset+frame_header.size; stop=start+fields[0]
+            if stop > end: raise ReplayError("frame troncato")
+            payload=data[start:stop]
+            if decompress:
+                try: payload=zlib.decompress(payload)
+                except zlib.error as e: raise ReplayError(f"frame corrotto: {e}")
+            yield offset, fields[1] if typed else FRAME_RECORD, payload
+            offset=stop
+
+    def records(self, offset=None):
+        # (tick, direzione) per ogni cambio di direzione; alla fine (tick, None)
+        for _, kind, frame in self.frames(offset):
+            if kind != FRAME_RECORD: continue
+            tick, pos = decode_varint(frame, 0)
+            while pos < len(frame):
+                value, pos = decode_varint(frame, pos)
+                tick+=value >> 3; code=value & 7
+                if code == CODE_END:
+                    self.final_score, pos = decode_varint(frame, pos)
+                    self.final_length, pos = decode_varint(frame, pos)
+                    self.end_tick=tick
+                    yield tick, None; return
+                if code >= len(CODE_DIRECTIONS): raise ReplayError(f"record sconosciuto: {code}")
+                yield tick, CODE_DIRECTIONS[code]
+
+    def total_ticks(self):
+        # Durata della partita (e risultato finale): dalla coda del file o, se manca,
+        # leggendo tutti i record
+        if self.end_tick is None:
+            for _ in self.records(): pass
+        return self.end_tick
+
+    def keyframe_before(self, tick):
+        # (offset, stato) dell'ultimo keyframe non successivo a tick, None se non ce n'è
+        if self.keyframe_ticks is None: self._scan_keyframes()
+        i=bisect.bisect_right(self.keyframe_ticks, tick)-1
+        if i < 0: return None
+        offset, kind, payload = next(self.frames(self.keyframe_offsets[i]))
+        if kind != FRAME_KEYFRAME: raise ReplayError("indice dei keyframe non valido")
+        return offset, unpack_keyframe(payload)
+
+
+class ReplayPlayer:
+    # Riproduce un replay tick per tick nel proprio motore: i record si decodificano man
+    # mano che servono, e seek() salta a qualunque tick ripartendo dal keyframe più vicino
+    def __init__(self, reader):
+        self.reader=reader; self.keyframe_interval=reader.header.keyframe_interval
+        self.engine=reader.header.new_engine()
+        self._read_from(None)
+
+    def _read_from(self, offset):
+        self.records=self.reader.records(offset)
+        self.next_tick, self.next_direction = next(self.records, (None, None))
+
+    def step(self):
+        engine=self.engine
+        if engine.game_over: return NO_EVENTS
+        direction=None
+        if self.next_direction is not None and self.next_tick == engine.tick+1:
+            direction=self.next_direction
+            self.next_tick, self.next_direction = next(self.records, (None, None))
+        events=engine.step(direction)
+        after_replay_step(engine, self.keyframe_interval)
+        return events
+
+    def seek(self, tick):
+        # All'indietro, o oltre il prossimo keyframe, si riparte dal keyframe; altrimenti si
+        # prosegue da dove si è. Il motore si ferma prima se la partita finisce prima.
+        engine=self.engine
+        if tick < engine.tick or (self.keyframe_interval and tick//self.keyframe_interval > engine.tick//self.keyframe_interval):
+            keyframe=self.reader.keyframe_before(tick)
+            engine.reset(seed=self.reader.header.seed, mode=self.reader.header.mode)
+            if keyframe is None: self._read_from(None)
+            else:
+                offset, state = keyframe
+                engine.restore(state); self._read_from(offset)
+        while engine.tick < tick and not engine.game_over: self.step()
+        return engine
+
+
+def simulate(path):
+    # Ri-simula un replay senza finestra e restituisce (motore nello stato finale, lettore).
+    # ReplayError se il file è danneggiato o non finisce dove la partita finisce.
+    with ReplayReader(path) as reader:
+        engine=reader.header.new_engine(); interval=reader.header.keyframe_interval
+        step=engine.step; end_tick=None
+        for tick, direction in reader.records():
+            if direction is None: end_tick=tick; break
+            if tick <= engine.tick: raise ReplayError("tick non crescenti")
+            while engine.tick < tick-1 and not engine.game_over: step(); after_replay_step(engine, interval)
+            if engine.game_over: raise ReplayError("comandi dopo la fine della partita")
+            step(direction); after_replay_step(engine, interval)
+        if end_tick is None: raise ReplayError("replay senza fine partita")
+        while engine.tick < end_tick and not engine.game_over: step(); after_replay_step(engine, interval)
+        if engine.tick != end_tick or not engine.game_over: raise ReplayError("la partita non finisce dove indicato")
+    return engine, reader
@@ -0,0 +1,117 @@
+# --- Verifica in blocco dei replay ---
+# Uso: python replay_verify.py leaderboard.json [altri .json/.db] [--replay-dir replays]
+#      python replay_verify.py replays/*.psr
+# Per ogni voce della leaderboard con un replay ri-simula la partita senza finestra e
+# controlla che punteggio, lunghezza finale e modalità coincidano con quelli dichiarati;
+# un file .psr passato da solo viene confrontato con il risultato scritto nel replay stesso.
+# Il lavoro è distribuito su tutti i core con un ProcessPoolExecutor che resta aperto per
+# tutta la verifica; i risultati vengono stampati man mano che arrivano.
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+import leaderboard_merge
+import leaderboard_store
+import replay
+
+IN_FLIGHT_PER_WORKER=4 # Replay in coda per processo: abbastanza per non lasciarli fermi, memoria limitata
+
+
+def verify_job(job):
+    # Eseguita nei processi del pool: restituisce (chiave, file, ok, motivo, tick simulati)
+    key, path, expected_score, expected_length, expected_mode = job
+    try: engine, reader = replay.simulate(path)
+    except (OSError, replay.ReplayError) as e: return key, path, False, f"replay non valido: {e}", 0
+    if expected_score is None: expected_score=reader.final_score
+    if expected_length is None: expected_length=reader.final_length
+    if expected_mode is not None and engine.mode != expected_mode:
+        return key, path, False, f"modalità {engine.mode}, dichiarata {expected_mode}", engine.tick
+    if engine.score != expected_score:
+        return key, path, False, f"punteggio {engine.score}, dichiarato {expected_score}", engine.tick
+    if engine.snake_length != expected_length:
+        return key, path, False, f"lunghezza {engine.snake_length}, dichiarata {expected_length}", engine.tick
+    return key, path, True, "", engine.tick
+
+
+class ReplayVerifier:
+    # Pool di processi persistente: si crea una volta e si riusa per tutti i lotti
+    def __init__(self, workers=None):
+        self.workers=workers or os.cpu_count() or 1
+        self.executor=concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def verify(self, jobs):
+        # Restituisce i risultati in ordine di completamento tenendo in volo al massimo
+        # IN_FLIGHT_PER_WORKER lavori per processo, anche con milioni di replay da verificare
+        jobs=iter(jobs); pending=set(); limit=self.workers*IN_FLIGHT_PER_WORKER
+        while True:
+            for job in jobs:
+                pending.add(self.executor.submit(verify_job, job))
+                if len(pending) >= limit: break
+            if not pending: return
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done: yield future.result()
+
+
+def iter_leaderboard_entries(path, stats):
+    # Solo lettura: i database vengono aperti con mode=ro, senza toccare schema né journal
+    if path.endswith(".db"): yield from leaderboard_merge.iter_sqlite(path, stats)
+    else: yield from leaderboard_merge.iter_json_items(path, stats)
+
+
+def build_jobs(inputs, replay_dir, entries, stats):
+    # Lavori per le voci con replay; le voci senza replay vengono solo contate. entries
+    # tiene (chiave -> voce) solo per i lavori ancora in corso.
+    key=0
+    for path in inputs:
+        if path.endswith(replay.REPLAY_EXTENSION):
+            key+=1; entries[key]=None; yield key, path, None, None, None; continue
+        for entry in iter_leaderboard_entries(path, stats):
+            if not entry.get("replay"): stats["missing"]+=1; continue
+            key+=1; entries[key]=entry
+            replay_path=os.path.join(replay_dir, os.path.basename(entry["replay"]))
+            yield key, replay_path, entry["score"], entry.get("length"), entry.get("mode")
+
+
+def parse_args(argv=None):
+    parser=argparse.ArgumentParser(description="Verifica i replay delle partite di PySnake")
+    parser.add_argument("inputs", nargs="+", help="leaderboard .json/.db o file replay .psr")
+    parser.add_argument("--replay-dir", default="replays", help="cartella dei replay citati dalla leaderboard")
+    parser.add_argument("--workers", type=int, default=None, help="processi da usare (default: tutti i core)")
+    parser.add_argument("--verified-output", default=None, help="scrive in questo file JSON solo le voci verificate")
+    parser.add_argument("--quiet", action="store_true", help="stampa solo il riepilogo")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args=parse_args(argv)
+    stats={"read":0, "invalid":0, "missing":0}; entries={}; verified=[]
+    ok_count=failed=ticks=0; start=time.perf_counter()
+    with ReplayVerifier(args.workers) as verifier:
+        for key, path, ok, reason, simulated_ticks in verifier.verify(build_jobs(args.inputs, args.replay_dir, entries, stats)):
+            entry=entries.pop(key); ticks+=simulated_ticks
+            if ok:
+                ok_count+=1
+                if entry is not None and args.verified_output: verified.append(entry)
+                continue
+            failed+=1
+            if not args.quiet:
+                label=f"{entry['name']} {entry['score']} ({path})" if entry else path
+                print(f"NON VALIDO {label}: {reason}")
+    elapsed=time.perf_counter()-start; total=ok_count+failed
+    if args.verified_output: leaderboard_merge.write_json_output(args.verified_output, leaderboard_store.sort_entries(verified))
+    print(f"{total:,} replay verificati in {elapsed:.2f} s ({total/elapsed if elapsed else 0:,.0f} replay/s, "
+          f"{ticks/elapsed if elapsed else 0:,.0f} tick/s): {ok_count:,} validi, {failed:,} non validi, "
+          f"{stats['missing']:,} voci senza replay")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# --- Visualizzatore dei replay ---
+# Uso: python replay_viewer.py replays/partita.psr [--speed 2]
+# Riproduce un replay con il renderer del gioco alla velocità che aveva la partita (che
+# cresce con il cibo mangiato come in game_loop). Si può saltare a qualunque tick: il
+# lettore riparte dal keyframe precedente e simula solo i tick che mancano (replay.py).
+# Comandi: Spazio pausa, Frecce ±5 s (Maiusc ±30 s), Home/Fine, 0-9 salto al 0-90%,
+# +/- velocità, "." un tick avanti in pausa, clic o trascinamento sulla barra, ESC esce.
+import argparse
+import os
+import sys
+
+import pygame
+
+import main
+import replay
+
+SEEK_SECONDS=5; SEEK_SECONDS_LONG=30
+SPEEDS=(0.25, 0.5, 1, 2, 4, 8, 16)
+MAX_STEPS_PER_FRAME=2000 # Alle velocità alte un frame non simula più di così
+PROGRESS_BAR_HEIGHT=6; PROGRESS_BAR_COLOR=(200,200,0); PROGRESS_BAR_BACK=(90,90,90)
+
+
+def tick_rate(engine):
+    # Tick al secondo che aveva la partita in questo punto (vedi current_game_fps in game_loop)
+    return min(main.INITIAL_FPS+engine.foods_eaten*main.FPS_INCREMENT_PER_FOOD, main.MAX_FPS)
+
+
+class ReplayViewer:
+    def __init__(self, path, speed=1):
+        self.reader=replay.ReplayReader(path); self.player=replay.ReplayPlayer(self.reader)
+        self.total_ticks=self.reader.total_ticks()
+        self.final_score=self.reader.final_score or 0
+        self.renderer=main.GameAreaRenderer()
+        self.speed_index=min(range(len(SPEEDS)), key=lambda i: abs(SPEEDS[i]-speed))
+        self.paused=False; self.dragging=False; self.budget=0.0; self.drawn_end=False
+        self.bar_rect=pygame.Rect(0, main.PANEL_HEIGHT-PROGRESS_BAR_HEIGHT, main.SCREEN_WIDTH, PROGRESS_BAR_HEIGHT)
+        self.caption=f"PySnake - replay {os.path.basename(path)}"; self.drawn_caption=None
+
+    @property
+    def engine(self):
+        return self.player.engine
+
+    def seek(self, tick):
+        self.player.seek(max(0, min(tick, self.total_ticks)))
+        self.renderer.invalidate(); self.budget=0.0; self.drawn_end=False
+
+    def seek_seconds(self, seconds):
+        self.seek(self.engine.tick+int(seconds*tick_rate(self.engine)))
+
+    def seek_to_x(self, x):
+        self.seek(round(max(0, min(x, main.SCREEN_WIDTH))*self.total_ticks/main.SCREEN_WIDTH))
+
+    def handle_event(self, event):
+        # False per uscire
+        if event.type == pygame.QUIT: return False
+        if event.type == pygame.KEYDOWN:
+            key=event.key; long_seek=event.mod & pygame.KMOD_SHIFT
+            if key in (pygame.K_ESCAPE, pygame.K_q): return False
+            if key == pygame.K_SPACE: self.paused=not self.paused; self.budget=0.0
+            elif key == pygame.K_LEFT: self.seek_seconds(-(SEEK_SECONDS_LONG if long_seek else SEEK_SECONDS))
+            elif key == pygame.K_RIGHT: self.seek_seconds(SEEK_SECONDS_LONG if long_seek else SEEK_SECONDS)
+            elif key == pygame.K_HOME: self.seek(0)
+            elif key == pygame.K_END: self.seek(self.total_ticks)
+            elif pygame.K_0 <= key <= pygame.K_9: self.seek(self.total_ticks*(key-pygame.K_0)//10)
+            elif key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS): self.speed_index=min(self.speed_index+1, len(SPEEDS)-1)
+            elif key in (pygame.K_MINUS, pygame.K_KP_MINUS): self.speed_index=max(self.speed_index-1, 0)
+            elif key == pygame.K_PERIOD and self.paused: self.advance(1)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.bar_rect.inflate(0,16).collidepoint(event.pos):
+            self.dragging=True; self.seek_to_x(event.pos[0])
+        elif event.type == pygame.MOUSEMOTION and self.dragging: self.seek_to_x(event.pos[0])
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1: self.dragging=False
+        return True
+
+    def advance(self, steps):
+        for _ in range(steps):
+            if self.engine.game_over: return
+            self.player.step(); self.renderer.apply_step(self.engine)
+
+    def update(self, elapsed):
+        # Tick da simulare nel tempo trascorso, alla velocità della partita nel punto attuale
+        if self.paused or self.dragging or self.engine.game_over: return
+        self.budget+=elapsed*SPEEDS[self.speed_index]; steps=0
+        while steps < MAX_STEPS_PER_FRAME and not self.engine.game_over:
+            interval=1.0/tick_rate(self.engine)
+            if self.budget < interval: break
+            self.budget-=interval; self.advance(1); steps+=1
+        if steps >= MAX_STEPS_PER_FRAME: self.budget=0.0
+
+    def draw(self):
+        if self.paused or self.dragging or self.engine.game_over or not main.INTERPOLATE_MOTION:
+            self.renderer.present(self.engine, self.final_score)
+        else: # Movimento verso il prossimo tick del replay, come in game_loop
+            player=self.player; tick=self.engine.tick
+            direction=player.next_direction if player.next_tick == tick+1 else self.engine.direction
+            self.renderer.present(self.engine, self.final_score, self.budget*tick_rate(self.engine), direction)
+        if self.engine.game_over and not self.drawn_end:
+            message="Fine del replay: vittoria" if self.engine.won else "Fine del replay"
+            main.display_message_game_area(message, main.WHITE, 0, main.fonts.game_over_font_small)
+            pygame.display.update(); self.drawn_end=True # Resta finché un salto non ridisegna tutto
+        # La barra sta sul bordo inferiore del pannello e si ridisegna a ogni frame
+        progress=self.engine.tick/self.total_ticks if self.total_ticks else 1.0
+        pygame.draw.rect(main.screen, PROGRESS_BAR_BACK, self.bar_rect)
+        pygame.draw.rect(main.screen, PROGRESS_BAR_COLOR, (0, self.bar_rect.y, round(progress*main.SCREEN_WIDTH), PROGRESS_BAR_HEIGHT))
+        pygame.display.update(self.bar_rect)
+        caption=f"{self.caption} - tick {self.engine.tick}/{self.total_ticks} - x{SPEEDS[self.speed_index]:g}{' (pausa)' if self.paused else ''}"
+        if caption != self.drawn_caption: pygame.display.set_caption(caption); self.drawn_caption=caption
+
+    def run(self):
+        clock=main.clock
+        try:
+            while True:
+                for event in pygame.event.get():
+                    if not self.handle_event(event): return
+                self.update(clock.get_time()/1000.0)
+                self.draw(); clock.tick(main.RENDER_FPS)
+        finally: self.reader.close()
+
+
+def parse_args(argv=None):
+    parser=argparse.ArgumentParser(description="Riproduce un replay di PySnake")
+    parser.add_argument("replay", help="file .psr")
+    parser.add_argument("--speed", type=float, default=1, help="velocità iniziale (0.25-16)")
+    parser.add_argument("--start", type=int, default=0, help="tick da cui partire")
+    return parser.parse_args(argv)
+
+
+def main_viewer(argv=None):
+    args=parse_args(argv)
+    main.bootstrap()
+    try: viewer=ReplayViewer(args.replay, args.speed)
+    except (OSError, replay.ReplayError) as e:
+        print(f"Replay non valido: {e}", file=sys.stderr); pygame.quit(); return 1
+    if args.start: viewer.seek(args.start)
+    viewer.run(); pygame.quit()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_viewer())
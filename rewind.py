@@ -0,0 +1,66 @@
+# --- Riavvolgimento della partita ---
+# Tiene gli ultimi tick giocati per poterli annullare uno alla volta (allenamento: tenendo
+# premuto un tasto la partita torna indietro). Due livelli, entrambi a capacità fissa:
+#   delta     per ogni tick solo ciò che step() ha cambiato (testa aggiunta, coda tolta,
+#             posizione nell'indice delle celle libere, direzione e cibo di prima, cibo
+#             mangiato): colonne di array preallocate usate ad anello, annullare un tick è O(1)
+#   snapshot  stato completo ogni snapshot_interval tick, per tornare ancora più indietro
+#             quando i delta sono finiti (si salta di snapshot in snapshot)
+# La memoria non dipende dalla durata della partita: al massimo max_bytes(). Dopo un
+# riavvolgimento lo stato è identico a quello di allora, indice delle celle libere compreso,
+# quindi anche il cibo successivo. Nessuna dipendenza da pygame.
+from array import array
+from collections import deque
+
+from snake_engine import DIRECTIONS, DIRECTION_INDEX
+
+REWIND_CAPACITY=1024 # Tick annullabili uno per uno (circa 20 s alla velocità massima)
+SNAPSHOT_INTERVAL=256; MAX_SNAPSHOTS=16 # Stati completi: altri 4096 tick a salti
+DELTA_BYTES=4*4+2 # Quattro colonne 'i' e due da un byte
+ARRAY_OVERHEAD=80 # Intestazione di un oggetto array (sys.getsizeof di un array vuoto, arrotondato)
+SNAPSHOT_OVERHEAD=640 # Tupla dello snapshot, i suoi interi, la coppia e le intestazioni dei due array
+
+
+class RewindHistory:
+    def __init__(self, capacity=REWIND_CAPACITY, snapshot_interval=SNAPSHOT_INTERVAL, max_snapshots=MAX_SNAPSHOTS):
+        self.capacity=capacity; self.snapshot_interval=snapshot_interval
+        self.heads=array('i', [0])*capacity; self.tails=array('i', [0])*capacity
+        self.taken=array('i', [0])*capacity; self.foods=array('i', [0])*capacity
+        self.directions=bytearray(capacity); self.ate=bytearray(capacity)
+        self.end=0; self.count=0 # Il delta più recente è in end-1 (modulo capacity)
+        self.snapshots=deque(maxlen=max_snapshots) # (snapshot(), copia di free_cells)
+
+    def clear(self):
+        self.end=0; self.count=0; self.snapshots.clear()
+
+    def max_bytes(self, grid_cells):
+        # Limite della memoria usata, oggetti Python compresi: delta preallocati più snapshot
+        # con board piena (corpo e celle libere, 4 byte a cella, insieme non superano le celle
+        # della griglia; l'array del corpo, costruito dal deque, può avere fino a 1/16 in più)
+        snapshot_bytes=grid_cells*4+grid_cells//4+SNAPSHOT_OVERHEAD
+        return self.capacity*DELTA_BYTES+6*ARRAY_OVERHEAD+self.snapshots.maxlen*snapshot_bytes
+
+    def record(self, engine, previous_direction, previous_food_idx, ate):
+        # Da chiamare dopo ogni step() non mortale, con direzione e cibo di prima del tick
+        i=self.end
+        self.heads[i]=engine.body[-1]; self.tails[i]=engine.last_tail_idx; self.taken[i]=engine.last_taken_pos
+        self.foods[i]=previous_food_idx; self.directions[i]=DIRECTION_INDEX[previous_direction]; self.ate[i]=ate
+        self.end=(i+1) % self.capacity
+        if self.count < self.capacity: self.count+=1
+        if self.snapshot_interval and engine.tick % self.snapshot_interval == 0:
+            self.snapshots.append((engine.snapshot(), array('i', engine.free_cells)))
+
+    def step_back(self, engine):
+        # Annulla un tick; finiti i delta salta allo snapshot precedente. False se non c'è
+        # più storia (inizio partita o oltre la capacità).
+        snapshots=self.snapshots
+        if self.count:
+            i=(self.end-1) % self.capacity; self.end=i; self.count-=1
+            engine.undo_step(self.heads[i], self.tails[i], self.taken[i], DIRECTIONS[self.directions[i]], self.foods[i], self.ate[i])
+            while snapshots and snapshots[-1][0][0] > engine.tick: snapshots.pop() # Stati di un futuro annullato
+            return True
+        while snapshots and snapshots[-1][0][0] >= engine.tick: snapshots.pop()
+        if not snapshots: return False
+        state, free_cells = snapshots.pop()
+        engine.restore(state, free_cells)
+        return True
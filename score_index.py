@@ -0,0 +1,146 @@
+# --- Indice dei punteggi per posizione e percentile ---
+# Conta tutti i punteggi registrati (per modalità e in totale) con un Fenwick tree sui
+# bucket di punteggio: inserimento, posizione in classifica e percentile costano
+# O(log B), con B numero di bucket, indipendentemente da quante partite sono state giocate.
+# L'indice viene salvato su disco accanto alla leaderboard. Nessuna dipendenza da pygame.
+import os
+import struct
+import sys
+from array import array
+
+import atomic_files
+from snake_engine import DEFAULT_GRID_WIDTH, DEFAULT_GRID_HEIGHT, POINTS_PER_FOOD
+
+SCORE_BUCKET=10 # I punteggi sono multipli di 10: un bucket per valore, posizioni esatte
+MAX_SCORE=DEFAULT_GRID_WIDTH*DEFAULT_GRID_HEIGHT*POINTS_PER_FOOD # Oltre non si arriva riempiendo la griglia
+ALL_MODES="ALL"
+INDEX_MAGIC=b"PSRK"; INDEX_VERSION=1
+
+
+class FenwickTree:
+    def __init__(self, size=1024):
+        self.counts=array('Q', bytes(8*size)) # Conteggi grezzi, per ricostruire dopo una crescita
+        self.tree=array('Q', bytes(8*(size+1)))
+        self.total=0
+
+    @classmethod
+    def from_counts(cls, counts):
+        fenwick=cls(0); fenwick.counts=array('Q', counts); fenwick._rebuild()
+        return fenwick
+
+    def _rebuild(self):
+        # Costruzione lineare a partire dai conteggi
+        size=len(self.counts); tree=array('Q', bytes(8*(size+1)))
+        for i in range(1, size+1):
+            tree[i]+=self.counts[i-1]
+            parent=i+(i & -i)
+            if parent <= size: tree[parent]+=tree[i]
+        self.tree=tree; self.total=sum(self.counts)
+
+    def _grow(self, min_size):
+        size=max(min_size, 2*len(self.counts))
+        self.counts.frombytes(bytes(8*(size-len(self.counts))))
+        self._rebuild()
+
+    def add(self, bucket, amount=1):
+        if bucket >= len(self.counts): self._grow(bucket+1)
+        self.counts[bucket]+=amount; self.total+=amount
+        tree=self.tree; size=len(self.counts); i=bucket+1
+        while i <= size:
+            tree[i]+=amount; i+=i & -i
+
+    def prefix_sum(self, bucket):
+        # Numero di elementi nei bucket 0..bucket inclusi
+        if bucket < 0: return 0
+        tree=self.tree; i=min(bucket+1, len(self.counts)); result=0
+        while i > 0:
+            result+=tree[i]; i-=i & -i
+        return result
+
+
+def score_bucket(score):
+    # I punteggi oltre MAX_SCORE finiscono tutti nell'ultimo bucket: un valore enorme arrivato
+    # da un file modificato non fa crescere gli array oltre ~1200 bucket
+    return min(max(0, int(score)), MAX_SCORE)//SCORE_BUCKET
+
+
+class ScoreRankIndex:
+    def __init__(self, path=None):
+        self.path=path; self.trees={}
+
+    def _tree(self, mode):
+        tree=self.trees.get(mode)
+        if tree is None: tree=self.trees[mode]=FenwickTree()
+        return tree
+
+    def add_score(self, score, mode=None):
+        bucket=score_bucket(score)
+        self._tree(ALL_MODES).add(bucket)
+        if mode is not None: self._tree(mode).add(bucket)
+
+    def total(self, mode=None):
+        tree=self.trees.get(ALL_MODES if mode is None else mode)
+        return tree.total if tree else 0
+
+    def rank(self, score, mode=None):
+        # Posizione (1 = migliore) che il punteggio avrebbe tra quelli registrati: 1 + quanti
+        # punteggi sono strettamente migliori
+        tree=self.trees.get(ALL_MODES if mode is None else mode)
+        if tree is None: return 1
+        return tree.total-tree.prefix_sum(score_bucket(score))+1
+
+    def percentile(self, score, mode=None):
+        # Percentuale dei punteggi registrati che stanno nella stessa fascia o sopra ("top x%")
+        total=self.total(mode)
+        return 100.0*self.rank(score, mode)/total if total else 100.0
+
+    # --- Persistenza: intestazione + per ogni modalità nome e conteggi dei bucket ---
+    def to_bytes(self):
+        chunks=[INDEX_MAGIC, struct.pack("<HH", INDEX_VERSION, len(self.trees))]
+        for mode, tree in self.trees.items():
+            name=mode.encode("utf-8"); counts=array('Q', tree.counts)
+            if sys.byteorder != "little": counts.byteswap()
+            chunks.append(struct.pack("<HI", len(name), len(counts))); chunks.append(name); chunks.append(counts.tobytes())
+        return b"".join(chunks)
+
+    def save(self, path=None, data=None):
+        # data permette di serializzare sotto lock e scrivere fuori (vedi LeaderboardService)
+        path=path or self.path
+        if data is None: data=self.to_bytes()
+        fd, tmp_path = atomic_files.create_temp_file(path, ".ranks-")
+        try:
+            with os.fdopen(fd,'wb') as f:
+                f.write(data); f.flush(); os.fsync(f.fileno())
+            atomic_files.replace_keeping_mode(tmp_path, path)
+        except BaseException:
+            try: os.unlink(tmp_path)
+            except OSError: pass
+            raise
+
+    @classmethod
+    def load(cls, path):
+        # Restituisce None se il file manca o non è valido (l'indice va ricostruito)
+        index=cls(path)
+        try:
+            with open(path,'rb') as f: data=f.read()
+        except OSError: return None
+        if data[:4] != INDEX_MAGIC: return None
+        try:
+            version, num_modes = struct.unpack_from("<HH", data, 4); offset=8
+            if version != INDEX_VERSION: return None
+            for _ in range(num_modes):
+                name_len, num_counts = struct.unpack_from("<HI", data, offset); offset+=6
+                mode=data[offset:offset+name_len].decode("utf-8"); offset+=name_len
+                counts=array('Q'); counts.frombytes(data[offset:offset+8*num_counts]); offset+=8*num_counts
+                if len(counts) != num_counts: return None
+                if sys.byteorder != "little": counts.byteswap()
+                index.trees[mode]=FenwickTree.from_counts(counts)
+        except (struct.error, UnicodeDecodeError): return None
+        return index
+
+    @classmethod
+    def build(cls, path, scores):
+        # Ricostruzione da un elenco di (punteggio, modalità), ad esempio dallo storico
+        index=cls(path)
+        for score, mode in scores: index.add_score(score, mode)
+        return index
@@ -0,0 +1,293 @@
+# --- Motore di gioco headless di PySnake ---
+# Contiene tutte le regole di gioco (movimento, collisioni, cibo, ostacoli) senza
+# dipendere da pygame: main.py si limita a leggere lo stato e a disegnarlo.
+import os
+import random
+from array import array
+from collections import deque
+
+UP=(0,-1); DOWN=(0,1); LEFT=(-1,0); RIGHT=(1,0)
+OPPOSITE={UP:DOWN, DOWN:UP, LEFT:RIGHT, RIGHT:LEFT}
+DIRECTIONS=(UP, DOWN, LEFT, RIGHT); DIRECTION_INDEX={direction: i for i, direction in enumerate(DIRECTIONS)}
+
+MODE_CLASSIC="CLASSIC"; MODE_OBSTACLES="OBSTACLES"; MODE_BORDERLESS="BORDERLESS"
+GAME_MODES=(MODE_CLASSIC, MODE_OBSTACLES, MODE_BORDERLESS)
+
+DEFAULT_GRID_WIDTH=40; DEFAULT_GRID_HEIGHT=30
+DEFAULT_NUM_OBSTACLES=10
+POINTS_PER_FOOD=10
+OBSTACLE_SAFE_RADIUS=3 # Area libera attorno alla testa all'inizio della partita
+
+# Contenuto delle celle nella griglia di occupazione (bytearray, una cella per byte)
+CELL_EMPTY=0; CELL_SNAKE=1; CELL_OBSTACLE=2
+
+MASK64=(1 << 64)-1
+
+# Eventi restituiti da step(): tuple costanti, così un tick non alloca nulla
+EVENT_EAT="EAT"; EVENT_DEATH="DEATH"; EVENT_WIN="BOARD_CLEARED"
+NO_EVENTS=(); EAT_EVENTS=(EVENT_EAT,); DEATH_EVENTS=(EVENT_DEATH,); WIN_EVENTS=(EVENT_EAT, EVENT_WIN)
+
+
+# Vicini di una cella in senso orario partendo da nord: due elementi consecutivi sono
+# sempre adiacenti tra loro, i vicini ortogonali sono quelli di indice pari.
+_RING_OFFSETS=((0,-1),(1,-1),(1,0),(1,1),(0,1),(-1,1),(-1,0),(-1,-1))
+
+
+def _build_removable_table():
+    # Per ogni maschera degli 8 vicini liberi dice se la cella centrale può diventare un
+    # ostacolo senza spezzare l'area libera: basta che tutti i vicini ortogonali liberi
+    # stiano nello stesso tratto contiguo dell'anello, così restano collegati senza di lei.
+    table=bytearray(256)
+    for mask in range(256):
+        free=[(mask >> i) & 1 for i in range(8)]
+        if all(free): table[mask]=1; continue
+        start=free.index(0) # Si parte da una cella bloccata per non spezzare un tratto
+        runs_with_orthogonal=0; in_run=False; run_has_orthogonal=False
+        for k in range(1, 9):
+            i=(start+k) % 8
+            if free[i]:
+                in_run=True; run_has_orthogonal=run_has_orthogonal or i % 2 == 0
+            elif in_run:
+                runs_with_orthogonal+=run_has_orthogonal; in_run=False; run_has_orthogonal=False
+        table[mask]=1 if runs_with_orthogonal <= 1 else 0
+    return bytes(table)
+
+_REMOVABLE=_build_removable_table()
+
+
+def generate_random_obstacles(rng, num_obstacles, snake_start_list, grid_width, grid_height, safe_radius=OBSTACLE_SAFE_RADIUS):
+    # Estrae gli ostacoli da un pool di celle candidate precalcolato (Fisher-Yates parziale,
+    # niente tentativi a vuoto) e accetta una cella solo se la sua rimozione lascia l'area
+    # libera connessa: il controllo è locale sugli 8 vicini, quindi O(1) per candidato.
+    # Se i candidati validi finiscono prima, restituisce meno ostacoli del richiesto.
+    padded_width=grid_width+2
+    # Griglia con cornice di celle bloccate: niente controlli sui bordi nel ciclo
+    blocked=bytearray([1])*(padded_width*(grid_height+2))
+    for y in range(grid_height):
+        row=(y+1)*padded_width+1
+        blocked[row:row+grid_width]=bytes(grid_width)
+    ring=[dy*padded_width+dx for dx, dy in _RING_OFFSETS]
+    n0, n1, n2, n3, n4, n5, n6, n7 = ring
+
+    head_x, head_y = snake_start_list[0]
+    # Area sicura attorno alla testa dello snake all'inizio, mai occupata da ostacoli
+    safe_x0=max(0, head_x-safe_radius+1); safe_x1=min(grid_width, head_x+safe_radius)
+    candidates=[]
+    for y in range(grid_height):
+        row=(y+1)*padded_width+1
+        if abs(y-head_y) < safe_radius:
+            candidates.extend(range(row, row+safe_x0)); candidates.extend(range(row+safe_x1, row+grid_width))
+        else:
+            candidates.extend(range(row, row+grid_width))
+    reserved={(y+1)*padded_width+x+1 for x, y in snake_start_list}
+    if reserved: candidates=[cell for cell in candidates if cell not in reserved]
+
+    obstacles=[]; removable=_REMOVABLE; random01=rng.random
+    num_candidates=len(candidates)
+    for i in range(num_candidates):
+        if len(obstacles) >= num_obstacles: break
+        j=i+int(random01()*(num_candidates-i))
+        cell=candidates[j]; candidates[j]=candidates[i]
+        mask=((not blocked[cell+n0]) | (not blocked[cell+n1]) << 1 | (not blocked[cell+n2]) << 2 | (not blocked[cell+n3]) << 3 |
+              (not blocked[cell+n4]) << 4 | (not blocked[cell+n5]) << 5 | (not blocked[cell+n6]) << 6 | (not blocked[cell+n7]) << 7)
+        if removable[mask]:
+            blocked[cell]=1
+            obstacles.append((cell % padded_width - 1, cell // padded_width - 1))
+    return obstacles
+
+
+def new_seed():
+    # Seme casuale per una nuova partita (64 bit)
+    return int.from_bytes(os.urandom(8), "little")
+
+
+def splitmix64(value):
+    # Mescola un intero a 64 bit (SplitMix64): a contatori consecutivi corrispondono
+    # valori indipendenti, quindi lo stato del generatore è solo (seme, contatore)
+    value=(value+0x9E3779B97F4A7C15) & MASK64
+    value=((value ^ (value >> 30))*0xBF58476D1CE4E5B9) & MASK64
+    value=((value ^ (value >> 27))*0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+
+class SnakeEngine:
+    # Il corpo è una deque di indici di cella impacchettati (y*larghezza+x), dalla coda
+    # (sinistra) alla testa (destra); la griglia di occupazione permette di controllare
+    # le collisioni, far crescere lo snake e spostare la coda in O(1) a ogni tick.
+    # Le celle libere sono tenute in un array indicizzabile (free_cells) con la mappa
+    # inversa cella -> posizione (free_pos): togliere/aggiungere una cella è uno swap-remove
+    # e il cibo si piazza con un'unica estrazione uniforme.
+    def __init__(self, grid_width=DEFAULT_GRID_WIDTH, grid_height=DEFAULT_GRID_HEIGHT, num_obstacles=DEFAULT_NUM_OBSTACLES):
+        self.grid_width=grid_width; self.grid_height=grid_height
+        self.num_obstacles=num_obstacles
+        self.start_pos=(grid_width//2, grid_height//2)
+        self.reset()
+
+    def reset(self, seed=None, mode=MODE_CLASSIC):
+        # Ogni partita ha il suo seme (se non indicato ne viene estratto uno): con lo stesso
+        # seme e gli stessi comandi la partita si ripete identica, vedi replay.py
+        if mode not in GAME_MODES: raise ValueError(f"Modalità sconosciuta: {mode}")
+        if seed is None: seed=new_seed()
+        self.seed=seed & MASK64; self.mode=mode
+        self.rng=random.Random(self.seed) # Solo per gli ostacoli, generati qui
+        self.food_counter=0
+        self.grid=bytearray(self.grid_width*self.grid_height)
+        self.obstacles=[]
+        if mode == MODE_OBSTACLES:
+            self.obstacles=generate_random_obstacles(self.rng, self.num_obstacles, [self.start_pos], self.grid_width, self.grid_height)
+            for x, y in self.obstacles: self.grid[y*self.grid_width+x]=CELL_OBSTACLE
+        self.body=deque()
+        self.head_x, self.head_y = self.start_pos
+        self._occupy(self.head_y*self.grid_width+self.head_x)
+        self._rebuild_free_cells()
+        self.snake_length=1
+        self.direction=RIGHT
+        self.score=0; self.foods_eaten=0; self.tick=0
+        self.game_over=False; self.won=False
+        self.last_tail_idx=-1 # Cella liberata dalla coda nell'ultimo tick (-1 se nessuna)
+        self.last_taken_pos=-1 # Posizione in free_cells della testa nell'ultimo tick di crescita (per undo_step)
+        self.food_idx=self._random_food_index()
+
+    def set_snake(self, cells, direction):
+        # Sostituisce il corpo con le celle indicate (dalla coda alla testa): serve a
+        # benchmark e strumenti per partire da uno snake già lungo.
+        for idx in self.body: self.grid[idx]=CELL_EMPTY
+        self.body.clear()
+        for x, y in cells: self._occupy(y*self.grid_width+x)
+        self.head_x, self.head_y = cells[-1]
+        self.snake_length=len(self.body); self.direction=direction
+        self._rebuild_free_cells()
+        if self.food_idx < 0 or self.grid[self.food_idx] != CELL_EMPTY: self.food_idx=self._random_food_index()
+
+    def _occupy(self, idx):
+        self.grid[idx]=CELL_SNAKE; self.body.append(idx)
+
+    def _rebuild_free_cells(self):
+        grid=self.grid
+        self.free_cells=array('i', (idx for idx in range(len(grid)) if grid[idx] == CELL_EMPTY))
+        self.free_pos=array('i', [-1])*len(grid)
+        for pos, idx in enumerate(self.free_cells): self.free_pos[idx]=pos
+
+    def _take_free_cell(self, idx):
+        free_cells=self.free_cells; free_pos=self.free_pos
+        pos=free_pos[idx]; last=free_cells.pop()
+        if last != idx: free_cells[pos]=last; free_pos[last]=pos
+        free_pos[idx]=-1
+
+    def canonicalize_free_cells(self):
+        # Riporta le celle libere in ordine crescente. L'ordine influisce sulle prossime
+        # estrazioni del cibo: i replay lo fanno a ogni keyframe, così per ripartire da un
+        # keyframe basta il corpo dello snake (restore ricostruisce lo stesso ordine).
+        self._rebuild_free_cells()
+
+    def snapshot(self):
+        # Stato completo della partita oltre a seme e modalità (ostacoli compresi, che
+        # dipendono solo dal seme): tuple di interi più le celle del corpo dalla coda, in un
+        # array 'i' (4 byte a cella: rewind.py ne tiene diversi in memoria)
+        return (self.tick, DIRECTION_INDEX[self.direction], self.snake_length, self.score, self.foods_eaten,
+                self.food_idx, self.food_counter, int(self.game_over), int(self.won), array('i', self.body))
+
+    def restore(self, state, free_cells=None):
+        # Ripristina uno snapshot() preso nella stessa partita (stesso seme e modalità, già
+        # impostati con reset); le celle libere tornano in ordine crescente, o nell'ordine
+        # di free_cells se indicato (copia di self.free_cells presa insieme allo snapshot)
+        tick, direction, snake_length, score, foods_eaten, food_idx, food_counter, game_over, won, body = state
+        grid=self.grid
+        for idx in self.body: grid[idx]=CELL_EMPTY
+        self.body.clear()
+        for idx in body: self._occupy(idx)
+        self.head_x, self.head_y = self.cell_pos(body[-1])
+        if free_cells is None: self._rebuild_free_cells()
+        else:
+            self.free_cells=array('i', free_cells); self.free_pos=array('i', [-1])*len(grid)
+            for pos, idx in enumerate(self.free_cells): self.free_pos[idx]=pos
+        self.tick=tick; self.direction=DIRECTIONS[direction]; self.snake_length=snake_length
+        self.score=score; self.foods_eaten=foods_eaten; self.food_idx=food_idx; self.food_counter=food_counter
+        self.game_over=bool(game_over); self.won=bool(won); self.last_tail_idx=-1
+
+    def undo_step(self, head_idx, tail_idx, taken_pos, direction, food_idx, ate):
+        # Annulla l'ultimo step() (non mortale) in O(1), con l'indice delle celle libere nello
+        # stesso ordine di prima: tail_idx -1 se lo snake stava crescendo (taken_pos è allora
+        # last_taken_pos), direction e food_idx quelli prima del tick. Vedi rewind.py.
+        grid=self.grid; body=self.body; free_cells=self.free_cells; free_pos=self.free_pos
+        body.pop(); grid[head_idx]=CELL_EMPTY
+        if tail_idx >= 0:
+            body.appendleft(tail_idx); grid[tail_idx]=CELL_SNAKE
+            pos=free_pos[tail_idx]; free_cells[pos]=head_idx; free_pos[head_idx]=pos; free_pos[tail_idx]=-1
+        else:
+            # Inverso di _take_free_cell: la cella spostata al posto della testa torna in fondo
+            last_pos=len(free_cells)
+            if taken_pos < last_pos:
+                last=free_cells[taken_pos]; free_cells.append(last); free_pos[last]=last_pos
+            else: free_cells.append(head_idx)
+            free_cells[taken_pos]=head_idx; free_pos[head_idx]=taken_pos
+        if ate:
+            if self.food_idx >= 0: self.food_counter-=1
+            self.snake_length-=1; self.score-=POINTS_PER_FOOD; self.foods_eaten-=1
+        self.food_idx=food_idx; self.direction=direction; self.tick-=1
+        self.head_x, self.head_y = self.cell_pos(body[-1])
+        self.game_over=False; self.won=False; self.last_tail_idx=-1
+
+    def cell_pos(self, idx):
+        return (idx % self.grid_width, idx // self.grid_width)
+
+    @property
+    def head(self):
+        return (self.head_x, self.head_y)
+
+    @property
+    def food_pos(self):
+        # None quando la board è piena e non c'è più posto per il cibo
+        return self.cell_pos(self.food_idx) if self.food_idx >= 0 else None
+
+    @property
+    def snake_list(self):
+        # Celle dello snake come coordinate (x, y), dalla coda alla testa
+        return [self.cell_pos(idx) for idx in self.body]
+
+    def _random_food_index(self):
+        # Estrazione uniforme tra le celle libere; -1 se non ne resta nessuna. Il generatore
+        # è a contatore (seme, numero di estrazioni): lo stato è salvabile in due interi.
+        if not self.free_cells: return -1
+        self.food_counter+=1
+        draw=splitmix64(self.seed ^ splitmix64(self.food_counter))
+        return self.free_cells[draw % len(self.free_cells)]
+
+    def step(self, direction=None):
+        # Avanza di un tick. direction=None mantiene la direzione attuale; un'inversione
+        # a 180° viene ignorata come faceva la gestione dei tasti in game_loop.
+        if self.game_over: return NO_EVENTS
+        if direction is not None and direction != OPPOSITE[self.direction]: self.direction=direction
+        self.tick+=1; self.last_tail_idx=-1
+        head_x=self.head_x+self.direction[0]; head_y=self.head_y+self.direction[1]
+
+        if self.mode == MODE_BORDERLESS:
+            head_x%=self.grid_width; head_y%=self.grid_height
+        elif not (0 <= head_x < self.grid_width and 0 <= head_y < self.grid_height):
+            self.game_over=True; return DEATH_EVENTS
+
+        idx=head_y*self.grid_width+head_x
+        grid=self.grid
+        # Come in origine, la coda conta ancora come occupata nel tick in cui si sposta
+        if grid[idx] != CELL_EMPTY:
+            self.game_over=True; return DEATH_EVENTS
+
+        body=self.body; free_cells=self.free_cells; free_pos=self.free_pos
+        grid[idx]=CELL_SNAKE; body.append(idx)
+        self.head_x=head_x; self.head_y=head_y
+        if len(body)>self.snake_length:
+            # La coda libera la sua cella e prende il posto della testa nell'indice:
+            # un solo swap invece di rimuovere e aggiungere
+            tail_idx=body.popleft(); grid[tail_idx]=CELL_EMPTY; self.last_tail_idx=tail_idx
+            pos=free_pos[idx]; free_cells[pos]=tail_idx; free_pos[tail_idx]=pos; free_pos[idx]=-1
+        else:
+            self.last_taken_pos=free_pos[idx]; self._take_free_cell(idx)
+
+        if idx == self.food_idx:
+            self.snake_length+=1; self.score+=POINTS_PER_FOOD; self.foods_eaten+=1
+            self.food_idx=self._random_food_index()
+            if self.food_idx < 0:
+                # Nessuna cella libera: la board è stata ripulita, partita vinta
+                self.game_over=True; self.won=True; return WIN_EVENTS
+            return EAT_EVENTS
+        return NO_EVENTS
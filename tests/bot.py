@@ -0,0 +1,23 @@
+# --- Giocatore automatico per le verifiche ---
+# Stessa strategia di benchmarks/bench_ghost.py, ma senza importare main (e quindi pygame):
+# verso il cibo evitando le celle occupate, con qualche svolta casuale. Con lo stesso rng le
+# partite sono identiche a ogni esecuzione e durano qualche migliaio di tick.
+from snake_engine import DIRECTIONS, OPPOSITE, CELL_EMPTY
+
+
+def bot_direction(engine, rng):
+    head_x, head_y = engine.head; food=engine.food_pos; options=[]
+    for direction in DIRECTIONS:
+        if direction == OPPOSITE[engine.direction]: continue
+        x=head_x+direction[0]; y=head_y+direction[1]
+        if 0 <= x < engine.grid_width and 0 <= y < engine.grid_height and engine.grid[y*engine.grid_width+x] == CELL_EMPTY:
+            options.append(direction)
+    if not options: return engine.direction
+    if food and rng.random() < 0.9: return min(options, key=lambda d: abs(head_x+d[0]-food[0])+abs(head_y+d[1]-food[1]))
+    return rng.choice(options)
+
+
+def engine_state(engine):
+    # Tutto ciò che decide il resto della partita, celle libere nel loro ordine comprese
+    state=engine.snapshot()
+    return state[:-1]+(list(state[-1]), list(engine.free_cells))
@@ -0,0 +1,61 @@
+# --- Verifica: pagine della classifica contro l'ordinamento completo ---
+# Uso: python tests/test_leaderboard_pager.py (oppure python -m pytest tests)
+# Classifiche casuali ma a seme fisso, su entrambi i backend, con voci in attesa di scrittura
+# unite dal pager: ogni pagina, il conteggio e position_of devono coincidere con quelli
+# ottenuti ordinando tutte le voci. Nessuna finestra, nessuna dipendenza da pygame.
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import leaderboard_store
+
+TRIALS=40; QUERIES=30
+MODES=("CLASSIC", "OBSTACLES")
+
+
+def random_entries(rng, prefix, count, first_timestamp):
+    # Pochi punteggi distinti: tanti pari merito, il caso in cui l'ordine è più delicato
+    return [leaderboard_store.make_entry(f"{prefix}{i}", rng.randrange(0, 10)*10, rng.choice(MODES), timestamp=first_timestamp+i)
+            for i in range(count)]
+
+
+def open_backend(directory, trial, entries):
+    if trial % 2:
+        backend=leaderboard_store.SqliteLeaderboard(os.path.join(directory, f"{trial}.db")); backend.add_entries(entries)
+    else:
+        backend=leaderboard_store.JsonLeaderboard(os.path.join(directory, f"{trial}.json"), 10**6)
+        backend.save(leaderboard_store.sort_entries(entries))
+    return backend
+
+
+def check_pager(backend, rng, entries, pending, mode):
+    stored=[entry for entry in leaderboard_store.sort_entries(entries) if mode is None or entry["mode"] == mode]
+    waiting=[entry for entry in pending if mode is None or entry["mode"] == mode]
+    truth=leaderboard_store.sort_entries(stored+waiting)
+    pager=leaderboard_store.LeaderboardPager(backend, mode, page_size=rng.choice((3, 7, 50)), pending=lambda: list(waiting))
+    assert pager.count() == len(truth)
+    for _ in range(QUERIES):
+        start=rng.randrange(0, len(truth)+3); count=rng.randrange(1, 20)
+        expected=[(i, truth[i]) for i in range(start, min(start+count, len(truth)))]
+        assert pager.rows(start, count) == expected, (mode, start, count)
+    for name in {entry["name"] for entry in truth[:10]} | {entry["name"] for entry in waiting}:
+        assert pager.position_of(name) == min(i for i, entry in enumerate(truth) if entry["name"] == name), name
+
+
+def test_pages_match_sorted_entries():
+    rng=random.Random(5)
+    with tempfile.TemporaryDirectory() as directory:
+        for trial in range(TRIALS):
+            entries=random_entries(rng, "p", rng.choice((0, 1, 5, 37, 120)), 0)
+            pending=random_entries(rng, "q", rng.choice((0, 1, 2, 4)), 1000)
+            backend=open_backend(directory, trial, entries)
+            try:
+                for mode in (None,)+MODES: check_pager(backend, rng, entries, pending, mode)
+            finally: backend.close()
+
+
+if __name__ == '__main__':
+    test_pages_match_sorted_entries()
+    print("Pager: tutte le pagine coincidono con la classifica ordinata")
@@ -0,0 +1,61 @@
+# --- Verifica: replay registrato contro la partita giocata ---
+# Uso: python tests/test_replay_seek.py (oppure python -m pytest tests)
+# Un bot gioca partite a seme fisso in tutte le modalità mentre ReplayWriter le registra, e
+# dopo ogni tick si annota lo stato del motore. Il replay deve ridare quegli stati: simulate()
+# alla fine, ReplayPlayer tick per tick e seek() verso tick casuali, avanti e indietro e a
+# cavallo dei keyframe. Nessuna finestra, nessuna dipendenza da pygame.
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import replay
+from snake_engine import SnakeEngine, GAME_MODES
+from bot import bot_direction, engine_state
+
+SEEDS=(1, 2, 3); SEEKS=60
+KEYFRAME_INTERVAL=64 # Più keyframe di una partita vera, per saltare spesso tra l'uno e l'altro
+
+
+def record_game(path, seed, mode):
+    # Gioca e registra una partita; restituisce gli stati dopo ogni tick (indice = tick)
+    rng=random.Random(seed); engine=SnakeEngine()
+    engine.reset(seed=seed, mode=mode)
+    writer=replay.ReplayWriter(path, replay.ReplayHeader.from_engine(engine, KEYFRAME_INTERVAL))
+    states=[engine_state(engine)]
+    while not engine.game_over:
+        previous=engine.direction; engine.step(bot_direction(engine, rng))
+        if engine.direction != previous: writer.record(engine.tick, engine.direction)
+        writer.after_step(engine); states.append(engine_state(engine))
+    writer.finish(engine.tick, engine.score, engine.snake_length)
+    return states
+
+
+def check_replay(path, states, rng):
+    engine, _ = replay.simulate(path)
+    assert engine_state(engine) == states[-1]
+    with replay.ReplayReader(path) as reader:
+        assert reader.total_ticks() == len(states)-1
+        player=replay.ReplayPlayer(reader)
+        for tick in range(1, len(states)):
+            player.step(); assert engine_state(player.engine) == states[tick], tick
+        for _ in range(SEEKS):
+            tick=rng.randrange(0, len(states))
+            assert engine_state(player.seek(tick)) == states[tick], tick
+        for tick in range(len(states)-1, -1, -KEYFRAME_INTERVAL//2): # All'indietro, da metà intervallo
+            assert engine_state(player.seek(tick)) == states[tick], tick
+
+
+def test_replay_matches_recorded_game():
+    rng=random.Random(7)
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in GAME_MODES:
+            for seed in SEEDS:
+                path=os.path.join(directory, f"{mode}-{seed}.psr")
+                check_replay(path, record_game(path, seed, mode), rng)
+
+
+if __name__ == '__main__':
+    test_replay_matches_recorded_game()
+    print("Replay: simulate, riproduzione e salti coincidono con le partite giocate")